@@ -1,22 +1,68 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import base64
 import csv
+import json
+import time
+import bisect
+import threading
+import queue
+import atexit
+import hashlib
+import gzip
+import zlib
+import mimetypes
+from urllib.parse import quote as url_quote
+import random
+import smtplib
+import shutil
+import zipfile
+from contextlib import contextmanager
+try: import fcntl
+except ImportError: fcntl = None # Windows: sem trava entre processos (o servidor de desenvolvimento roda em um processo só)
+from itertools import islice
+from collections import Counter, OrderedDict
 from io import StringIO
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify, Blueprint, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, jsonify, Blueprint, Response, stream_with_context, make_response, abort
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 # CORREÇÃO: Removido 'Room' da importação
 from flask_socketio import SocketIO, join_room, leave_room, send, emit 
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
 from functools import wraps
-from datetime import datetime
-from sqlalchemy import or_, func, and_
-from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta
+from sqlalchemy import or_, func, and_, text, literal_column, table, column, case, tuple_, insert, update, bindparam, true
+from sqlalchemy.orm import aliased, joinedload, contains_eager, selectinload
+from sqlalchemy.exc import IntegrityError, DataError
 from flask_migrate import Migrate
 from flask_mail import Mail, Message
 from celery import Celery
+from celery.exceptions import MaxRetriesExceededError
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+import redis
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadTimeSignature
+from search import search_document, fts5_match_expression, tsquery_expression, normalize_text, PrefixIndex
+try:
+    from PIL import Image, ImageOps, features as pil_features
+except ImportError:  # Pillow é opcional: sem ele as páginas usam só a imagem original
+    Image = None
+try:
+    import brotli
+except ImportError:  # sem o pacote brotli, as respostas e os arquivos estáticos usam apenas gzip
+    brotli = None
+try:
+    import openpyxl
+except ImportError:  # sem openpyxl, os relatórios não são oferecidos em XLSX
+    openpyxl = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow, os relatórios não são oferecidos em Parquet
+    pa = None
 
 # --- Configuração da Aplicação ---
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -48,7 +94,7 @@ def make_celery(app):
 # --- Inicialização das Extensões ---
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
-socketio = SocketIO(app)
+socketio = SocketIO(app, message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'], channel=app.config['SOCKETIO_CHANNEL'])
 mail = Mail(app)
 celery = make_celery(app)
 
@@ -58,23 +104,324 @@ ATTACHMENT_FOLDER = app.config['ATTACHMENT_FOLDER']
 CHAT_ATTACHMENT_FOLDER = app.config['CHAT_ATTACHMENT_FOLDER']
 ALLOWED_IMG_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 ALLOWED_ATTACH_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'jpg', 'jpeg', 'png'}
+QUOTE_STATUSES = ('Pendente', 'Respondido', 'Aceito', 'Recusado')
 
 
+# --- Redis Compartilhado (opcional) ---
+_redis_client = None
+def get_redis():
+    """Cliente Redis de REDIS_URL, ou None quando o app roda só com memória local."""
+    global _redis_client
+    if _redis_client is None and app.config.get('REDIS_URL'):
+        _redis_client = redis.Redis.from_url(app.config['REDIS_URL'], socket_timeout=0.5)
+    return _redis_client
+
+# --- Contador de Notificações Não Lidas ---
+class UnreadCounter:
+    """
+    Cache do número de notificações não lidas por empresa: no Redis quando
+    REDIS_URL está definido, senão em memória no próprio processo.
+    get() retorna None quando o valor não está em cache.
+    """
+    # Incrementa apenas se a chave já existir (senão o próximo get() recarrega do banco)
+    INCR_IF_EXISTS = "if redis.call('exists', KEYS[1]) == 1 then return redis.call('incrby', KEYS[1], ARGV[1]) end return nil"
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._local = {}  # company_id -> (contagem, expira_em)
+        self._lock = threading.Lock()
+
+    def _key(self, company_id): return f"notifications:unread:{company_id}"
+
+    def get(self, company_id):
+        client = get_redis()
+        if client is not None:
+            try:
+                value = client.get(self._key(company_id))
+                return int(value) if value is not None else None
+            except redis.RedisError as e: app.logger.warning(f"Contador de notificações: Redis indisponível ({e})"); return None
+        entry = self._local.get(company_id)
+        return entry[0] if entry and entry[1] > time.monotonic() else None
+
+    def set(self, company_id, count):
+        client = get_redis()
+        if client is not None:
+            try: client.set(self._key(company_id), count, ex=self.ttl)
+            except redis.RedisError as e: app.logger.warning(f"Contador de notificações: Redis indisponível ({e})")
+            return
+        with self._lock: self._local[company_id] = (count, time.monotonic() + self.ttl)
+
+    def incr(self, company_id, amount=1):
+        """Soma 'amount' ao contador em cache e retorna o novo valor (None se não estava em cache)."""
+        return self.incr_many({company_id: amount})[company_id]
+
+    def incr_many(self, amounts):
+        """incr() para vários contadores {company_id: quantidade} de uma vez (uma ida ao Redis)."""
+        client = get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for company_id, amount in amounts.items(): pipe.eval(self.INCR_IF_EXISTS, 1, self._key(company_id), amount)
+                return {company_id: int(value) if value is not None else None for company_id, value in zip(amounts, pipe.execute())}
+            except redis.RedisError as e: app.logger.warning(f"Contador de notificações: Redis indisponível ({e})"); return dict.fromkeys(amounts)
+        values = {}; now = time.monotonic()
+        with self._lock:
+            for company_id, amount in amounts.items():
+                entry = self._local.get(company_id)
+                if not entry or entry[1] <= now: values[company_id] = None; continue
+                self._local[company_id] = (entry[0] + amount, entry[1])
+                values[company_id] = entry[0] + amount
+        return values
+
+unread_counter = UnreadCounter(ttl=app.config['UNREAD_CACHE_TTL'])
+
+class SharedCache:
+    """Cache de valores JSON com validade: no Redis quando REDIS_URL está definido, senão em memória no processo."""
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._local = {}  # chave -> (valor, expira_em)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        client = get_redis()
+        if client is not None:
+            try:
+                value = client.get(f"{self.prefix}:{key}")
+                return json.loads(value) if value is not None else None
+            except redis.RedisError as e: app.logger.warning(f"Cache {self.prefix}: Redis indisponível ({e})"); return None
+        entry = self._local.get(key)
+        return entry[0] if entry and entry[1] > time.monotonic() else None
+
+    def set(self, key, value, ttl):
+        client = get_redis()
+        if client is not None:
+            try: client.set(f"{self.prefix}:{key}", json.dumps(value), ex=ttl)
+            except redis.RedisError as e: app.logger.warning(f"Cache {self.prefix}: Redis indisponível ({e})")
+            return
+        with self._lock: self._local[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        client = get_redis()
+        if client is not None:
+            try: client.delete(f"{self.prefix}:{key}")
+            except redis.RedisError as e: app.logger.warning(f"Cache {self.prefix}: Redis indisponível ({e})")
+            return
+        with self._lock: self._local.pop(key, None)
+
+# --- Cache de Fragmentos HTML ---
+class FragmentCache:
+    """
+    Cache de trechos de HTML já renderizados, por tipo ('product', 'supplier_header', ...) e chave.
+    No Redis quando REDIS_URL está definido (com validade 'ttl'); senão num LRU no processo que
+    descarta os menos usados quando passa de 'max_bytes'. Acertos e faltas são contados por processo.
+    """
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl; self.max_bytes = max_bytes
+        self._local = OrderedDict()  # (tipo, chave) -> (html, expira_em, tamanho)
+        self._local_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = Counter(); self.misses = Counter()
+
+    def _key(self, kind, key): return f"fragment:{kind}:{key}"
+
+    def _discard(self, local_key):
+        entry = self._local.pop(local_key, None)
+        if entry: self._local_bytes -= entry[2]
+
+    def get(self, kind, key):
+        client = get_redis(); value = None
+        if client is not None:
+            try:
+                value = client.get(self._key(kind, key))
+                if value is not None: value = value.decode()
+            except redis.RedisError as e: app.logger.warning(f"Cache de fragmentos: Redis indisponível ({e})")
+        with self._lock:
+            if client is None:
+                entry = self._local.get((kind, key))
+                if entry and entry[1] > time.monotonic(): self._local.move_to_end((kind, key)); value = entry[0]
+                elif entry: self._discard((kind, key))
+            (self.hits if value is not None else self.misses)[kind] += 1
+        return value
+
+    def set(self, kind, key, html):
+        client = get_redis()
+        if client is not None:
+            try: client.set(self._key(kind, key), html, ex=self.ttl)
+            except redis.RedisError as e: app.logger.warning(f"Cache de fragmentos: Redis indisponível ({e})")
+            return
+        size = sys.getsizeof(html)
+        if size > self.max_bytes // 4: return # um fragmento enorme esvaziaria o cache inteiro
+        with self._lock:
+            self._discard((kind, key))
+            self._local[(kind, key)] = (html, time.monotonic() + self.ttl, size); self._local_bytes += size
+            while self._local_bytes > self.max_bytes: self._discard(next(iter(self._local)))
+
+    def delete(self, kind, *keys):
+        if not keys: return
+        client = get_redis()
+        if client is not None:
+            try: client.delete(*[self._key(kind, key) for key in keys])
+            except redis.RedisError as e: app.logger.warning(f"Cache de fragmentos: Redis indisponível ({e})")
+            return
+        with self._lock:
+            for key in keys: self._discard((kind, key))
+
+    def stats(self):
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {'backend': 'redis' if get_redis() is not None else 'local', 'local_entries': len(self._local), 'local_bytes': self._local_bytes,
+                    'kinds': {kind: {'hits': self.hits[kind], 'misses': self.misses[kind],
+                                     'hit_rate': round(self.hits[kind] / (self.hits[kind] + self.misses[kind]), 3)} for kind in kinds}}
+
+fragment_cache = FragmentCache(ttl=app.config['FRAGMENT_CACHE_TTL'], max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'])
+
+def cached_fragment(kind, key, render):
+    """HTML do fragmento, do cache; sem ele, chama render() (que faz as consultas) e guarda o resultado."""
+    html = fragment_cache.get(kind, key)
+    if html is None:
+        html = render(); fragment_cache.set(kind, key, html)
+    return Markup(html)
+
 # --- Funções de E-mail Assíncrono (com Celery) ---
-@celery.task
-def send_async_email(subject, recipients, html_body):
-    """Tarefa Celery para enviar e-mail."""
-    msg = Message(subject, recipients=recipients, html=html_body)
-    with app.app_context():
+email_logger = get_task_logger('connecta.email')
+EMAIL_OUTBOX_KEY = 'email:outbox'
+EMAIL_FLUSH_KEY = 'email:outbox:flush_scheduled'
+
+class SMTPPool:
+    """
+    Conexão SMTP persistente do processo do worker (mail.connect()), reaproveitada entre
+    tarefas. É reaberta quando o servidor a derruba e, pelo próprio Flask-Mail, a cada
+    MAIL_MAX_EMAILS mensagens. Respeita no máximo MAIL_RATE_LIMIT envios por segundo.
+    """
+
+    def __init__(self, rate_limit):
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0
+        self._connection = None
+        self._last_send = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self.close()
+        self._connection = mail.connect().__enter__()
+
+    def close(self):
+        if self._connection is None: return
+        try: self._connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError): pass  # a conexão já caiu
+        self._connection = None
+
+    def send(self, msg):
+        with self._lock:
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0: time.sleep(wait)
+            if self._connection is None: self._connect()
+            try: self._connection.send(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Conexão ociosa fechada pelo servidor: reabre e tenta uma vez
+                self._connect(); self._connection.send(msg)
+            self._last_send = time.monotonic()
+
+smtp_pool = SMTPPool(app.config['MAIL_RATE_LIMIT'])
+
+@worker_process_shutdown.connect
+def close_smtp_pool(**kwargs): smtp_pool.close()
+
+def is_transient_email_error(error):
+    """Falhas que valem nova tentativa: conexão/tempo esgotado ou respostas SMTP 4xx."""
+    if isinstance(error, smtplib.SMTPResponseException): return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused): return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+@celery.task(bind=True, max_retries=app.config['MAIL_MAX_RETRIES'])
+def send_email_batch(self, messages):
+    """
+    Monta (ver build_email) e envia uma lista de e-mails ({'template', 'params'}) pela conexão SMTP
+    do worker. Em falha temporária, os e-mails ainda não enviados voltam para a fila com espera exponencial.
+    """
+    failed = []
+    for i, data in enumerate(messages):
         try:
-            mail.send(msg)
-            print(f"E-mail enviado para {recipients}")
+            msg = build_email(data['template'], data['params'])
+            if msg is None:
+                email_logger.warning(f"E-mail '{data['template']}' descartado: registro {data['params']} não existe mais"); continue
+            smtp_pool.send(msg)
         except Exception as e:
-            print(f"Erro ao enviar e-mail: {e}")
+            if not is_transient_email_error(e):
+                email_logger.error(f"E-mail '{data['template']}' {data['params']} descartado: {e}"); continue
+            email_logger.warning(f"Falha temporária no envio de e-mail ({e}); {len(messages) - i} na fila para nova tentativa")
+            smtp_pool.close(); failed = messages[i:]; break
+    email_logger.info(f"{len(messages) - len(failed)} e-mail(s) enviado(s)")
+    if failed:
+        countdown = app.config['MAIL_RETRY_BACKOFF'] * 2 ** self.request.retries
+        try: raise self.retry(args=(failed,), countdown=countdown + random.uniform(0, countdown / 2))
+        except MaxRetriesExceededError:
+            email_logger.error(f"{len(failed)} e-mail(s) descartado(s) após {self.max_retries} tentativas")
 
-def send_email(subject, recipients, html_body):
-    """Chama a tarefa Celery de forma assíncrona."""
-    send_async_email.delay(subject, recipients, html_body)
+@celery.task
+def flush_email_outbox():
+    """Esvazia a fila de e-mails do Redis em lotes de MAIL_BATCH_SIZE, um send_email_batch por lote."""
+    client = get_redis()
+    if client is None: return
+    client.delete(EMAIL_FLUSH_KEY)  # e-mails enfileirados a partir daqui agendam um novo flush
+    while True:
+        batch = client.lpop(EMAIL_OUTBOX_KEY, app.config['MAIL_BATCH_SIZE'])
+        if not batch: break
+        send_email_batch.delay([json.loads(item) for item in batch])
+
+def send_email(template, **params):
+    """
+    Enfileira o e-mail 'template' (ver EMAIL_TEMPLATES) só com os ids necessários; o worker
+    carrega os dados e renderiza o HTML. Com Redis, os e-mails acumulam por MAIL_BATCH_DELAY
+    segundos e seguem em lotes; sem Redis, cada e-mail vira uma tarefa.
+    """
+    message = {'template': template, 'params': params}
+    client = get_redis()
+    if client is not None:
+        try:
+            client.rpush(EMAIL_OUTBOX_KEY, json.dumps(message))
+            if client.set(EMAIL_FLUSH_KEY, 1, nx=True, ex=60): flush_email_outbox.apply_async(countdown=app.config['MAIL_BATCH_DELAY'])
+            return
+        except redis.RedisError as e: app.logger.warning(f"Fila de e-mails: Redis indisponível ({e})")
+    send_email_batch.delay([message])
+
+# Dados dos e-mails, carregados no worker a partir dos ids: cada função retorna (destinatários, contexto do template) ou None
+def _reset_password_email(company_id):
+    company = db.session.get(Company, company_id)
+    if company is None: return None
+    token = s.dumps(company.email, salt='password-reset-salt')  # válido por 30 minutos
+    return [company.email], {'company_name': company.company_name, 'reset_url': url_for('reset_password', token=token, _external=True)}
+
+def _quote_email(recipient):
+    """E-mails sobre uma cotação, para o comprador ou o fornecedor, com nomes e e-mails em uma única consulta."""
+    def load(quote_id):
+        buyer = aliased(Company); supplier = aliased(Company)
+        quote = (db.session.query(QuoteRequest.id, Product.name.label('product_name'), buyer.company_name.label('buyer_name'), buyer.email.label('buyer_email'),
+                                  supplier.company_name.label('supplier_name'), supplier.email.label('supplier_email'))
+                 .join(Product, QuoteRequest.product_id == Product.id).join(buyer, QuoteRequest.buyer_id == buyer.id).join(supplier, QuoteRequest.supplier_id == supplier.id)
+                 .filter(QuoteRequest.id == quote_id).first())
+        if quote is None: return None
+        return [getattr(quote, f'{recipient}_email')], {'quote': quote, 'quote_url': url_for('quote_detail', quote_id=quote.id, _external=True)}
+    return load
+
+EMAIL_TEMPLATES = {
+    'reset_password': ("Recuperação de Senha - Connecta B2B", _reset_password_email),
+    'quote_responded': ("Sua cotação foi respondida!", _quote_email('buyer')),
+    'quote_accepted': ("Sua proposta foi aceita!", _quote_email('supplier')),
+    'quote_declined': ("Sua proposta foi recusada.", _quote_email('supplier')),
+}
+
+def build_email(template, params):
+    """
+    Renderiza templates/email/<template>.html no worker (os templates compilados ficam no
+    cache do Jinja do processo). Os links usam EMAIL_BASE_URL, já que não há requisição.
+    Retorna None se o registro não existir mais.
+    """
+    subject, load = EMAIL_TEMPLATES[template]
+    with app.test_request_context(base_url=app.config['EMAIL_BASE_URL']):
+        data = load(**params)
+        if data is None: return None
+        recipients, context = data
+        return Message(subject, recipients=recipients, html=render_template(f'email/{template}.html', **context))
 
 
 # --- Funções Auxiliares e Decoradores ---
@@ -97,20 +444,218 @@ def supplier_required(f):
         if session.get('user_type') != 'supplier': flash('Acesso negado a esta área.', 'error'); return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
     return decorated_function
+def encode_cursor(timestamp, row_id):
+    """Cursor de paginação (keyset) para listas ordenadas por (timestamp, id)."""
+    return f"{timestamp.strftime('%Y%m%d%H%M%S%f')}-{row_id}"
+def decode_cursor(cursor):
+    """(timestamp, id) de um cursor gerado por encode_cursor, ou None se for inválido."""
+    try:
+        timestamp_str, row_id = cursor.split('-', 1)
+        return datetime.strptime(timestamp_str, '%Y%m%d%H%M%S%f'), int(row_id)
+    except (AttributeError, ValueError): return None
+def keyset_page(query, timestamp_column, id_column, cursor, page_size):
+    """
+    Página de 'query' em ordem decrescente de (timestamp, id) a partir do cursor. Retorna (itens, cursor da próxima página ou None).
+    A coluna de timestamp precisa ser NOT NULL: um nulo quebra o cursor e a comparação por tupla.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position: query = query.filter(tuple_(timestamp_column, id_column) < position)
+    items = query.order_by(timestamp_column.desc(), id_column.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]; next_cursor = encode_cursor(items[-1].timestamp, items[-1].id)
+    return items, next_cursor
+def send_protected_file(folder, filename):
+    """
+    Envia um anexo já autorizado. Conforme DOWNLOAD_OFFLOAD, a transferência fica com o proxy
+    (X-Accel-Redirect do nginx ou X-Sendfile) ou com o próprio Flask, que atende Range e
+    requisições condicionais (ETag/Last-Modified) para downloads retomáveis.
+    """
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path): return 'Arquivo não encontrado.', 404
+    mode = app.config['DOWNLOAD_OFFLOAD']
+    if mode == 'direct':
+        response = send_from_directory(folder, filename, as_attachment=True)
+    else:
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        if mode == 'x-accel':
+            internal_path = os.path.relpath(path, app.config['DOWNLOAD_ACCEL_ROOT']).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + url_quote(internal_path)
+        else: response.headers['X-Sendfile'] = path
+    response.cache_control.private = True # anexos só podem ficar no cache do próprio usuário
+    return response
+def format_timestamp(value): return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+def gzip_chunks(chunks):
+    """Comprime em gzip, à medida que são gerados, os pedaços de texto de um download em streaming."""
+    compressor = zlib.compressobj(app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed: yield compressed
+    yield compressor.flush()
+def csv_download(query, filename, columns, compress=False):
+    """
+    Baixa o resultado de 'query' em CSV sem carregá-lo na memória: as linhas vêm do banco em lotes de
+    EXPORT_CHUNK_SIZE (yield_per, com cursor do lado do servidor) e passam por um único buffer reaproveitado.
+    'columns' é uma lista de (título, função que extrai o valor da linha). Com compress=True, sai em .csv.gz.
+    """
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    def generate():
+        data = StringIO(); writer = csv.writer(data)
+        writer.writerow([title for title, _ in columns])
+        for i, row in enumerate(query.yield_per(chunk_size), 1):
+            writer.writerow([value(row) for _, value in columns])
+            if i % chunk_size == 0: yield data.getvalue(); data.seek(0); data.truncate(0)
+        yield data.getvalue()
+    chunks = gzip_chunks(generate()) if compress else generate()
+    response = Response(stream_with_context(chunks), mimetype='application/gzip' if compress else 'text/csv')
+    response.headers.set("Content-Disposition", "attachment", filename=filename + '.gz' if compress else filename)
+    return response
 @app.context_processor
 def inject_notifications():
     if 'company_id' in session:
-        unread_count = db.session.query(Notification).filter_by(recipient_id=session['company_id'], read=False).count()
+        unread_count = unread_notification_count(session['company_id'])
         cart_item_count = len(session.get('cart', {})) if session.get('user_type') == 'buyer' else 0
         return dict(unread_notifications=unread_count, cart_item_count=cart_item_count)
     return dict(unread_notifications=0, cart_item_count=0)
 
+# --- Arquivos Estáticos e Compressão ---
+STATIC_BUILD_DIR = 'dist' # subpasta de static/ com as cópias geradas por "flask build-assets"
+STATIC_ASSET_FOLDERS = ('css', 'js')
+asset_manifest = {} # 'css/style.css' -> 'dist/css/style.<hash>.css'
+
+def build_static_assets():
+    """
+    Copia os CSS/JS para static/dist/ com o hash do conteúdo no nome, mais as versões .gz e .br já
+    comprimidas, e grava o manifesto usado por url_for('static'). Cópias de versões anteriores são
+    mantidas para as páginas que ainda estão em cache nos navegadores.
+    """
+    manifest = {}
+    for folder in STATIC_ASSET_FOLDERS:
+        os.makedirs(os.path.join(app.static_folder, STATIC_BUILD_DIR, folder), exist_ok=True)
+        for name in sorted(os.listdir(os.path.join(app.static_folder, folder))):
+            with open(os.path.join(app.static_folder, folder, name), 'rb') as f: content = f.read()
+            stem, ext = os.path.splitext(name)
+            hashed = f"{STATIC_BUILD_DIR}/{folder}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+            target = os.path.join(app.static_folder, hashed)
+            if not os.path.exists(target):
+                with open(target + '.gz', 'wb') as f: f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli:
+                    with open(target + '.br', 'wb') as f: f.write(brotli.compress(content, quality=11))
+                with open(target, 'wb') as f: f.write(content)
+            manifest[f"{folder}/{name}"] = hashed
+    manifest_path = os.path.join(app.static_folder, STATIC_BUILD_DIR, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as f: json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    asset_manifest.clear(); asset_manifest.update(manifest)
+    return manifest
+
+def load_asset_manifest():
+    """Carrega o manifesto na inicialização; sem ele (ex.: em desenvolvimento), os arquivos originais são usados."""
+    try:
+        with open(os.path.join(app.static_folder, STATIC_BUILD_DIR, 'manifest.json')) as f: asset_manifest.update(json.load(f))
+    except (OSError, ValueError): pass
+load_asset_manifest()
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in asset_manifest: values['filename'] = asset_manifest[values['filename']]
+
+def is_fingerprinted_asset():
+    return request.endpoint == 'static' and request.view_args.get('filename', '').startswith(STATIC_BUILD_DIR + '/')
+
+def preferred_encoding():
+    """'br' ou 'gzip', conforme o Accept-Encoding do cliente (brotli só se o pacote estiver instalado)."""
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+# Pastas onde os anexos ficavam dentro de static/; bloqueadas para que arquivos ainda não movidos não saiam sem checagem
+LEGACY_ATTACHMENT_PREFIXES = ('attachments/', 'chat_attachments/')
+
+@app.before_request
+def block_legacy_attachments():
+    if request.endpoint == 'static' and request.view_args.get('filename', '').lstrip('/').startswith(LEGACY_ATTACHMENT_PREFIXES): abort(404)
+
+@app.before_request
+def serve_precompressed_asset():
+    # Entrega o .br/.gz gerado no build no lugar do arquivo com hash (o nginx pode fazer o mesmo com gzip_static)
+    if not is_fingerprinted_asset(): return None
+    encoding = preferred_encoding(); filename = request.view_args['filename']
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding)
+    if not suffix or not os.path.exists(os.path.join(app.static_folder, filename + suffix)): return None
+    response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetypes.guess_type(filename)[0])
+    response.headers['Content-Encoding'] = encoding; response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def cache_and_compress(response):
+    if is_fingerprinted_asset():
+        # O nome muda junto com o conteúdo, então o navegador nunca precisa revalidar
+        response.cache_control.no_cache = None; response.cache_control.public = True; response.cache_control.max_age = app.config['STATIC_IMMUTABLE_MAX_AGE']; response.cache_control.immutable = True
+        return response
+    if (response.mimetype not in ('text/html', 'application/json') or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = preferred_encoding()
+    data = response.get_data()
+    if not encoding or len(data) < app.config['COMPRESS_MIN_SIZE']: return response
+    response.set_data(brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY']) if encoding == 'br'
+                      else gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# --- Requisições Condicionais (ETag) ---
+# O ETag sai das versões dos dados (colunas updated_at indexadas, versão do índice de autocompletar),
+# calculadas antes das consultas caras: se o navegador já tem a versão, a rota responde 304 sem montar nada.
+def _pages_version():
+    """Hash dos templates e do manifesto dos estáticos: publicar uma nova versão muda o ETag de todas as páginas."""
+    digest = hashlib.sha1(json.dumps(asset_manifest, sort_keys=True).encode())
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f: digest.update(f.read())
+    return digest.hexdigest()[:12]
+PAGES_VERSION = _pages_version()
+
+def page_viewer_state():
+    """O que as páginas mostram do usuário logado (cabeçalho, carrinho, notificações); entra no ETag das páginas HTML."""
+    company_id = session.get('company_id')
+    return (PAGES_VERSION, company_id, session.get('company_name'), session.get('user_type'), session.get('is_admin'),
+            len(session.get('cart', {})), unread_notification_count(company_id) if company_id else 0)
+
+def conditional_etag(*versions):
+    """
+    ETag a partir das versões dos dados que a resposta usa. Retorna (etag, resposta 304 ou None).
+    Só para respostas que não exibem mensagens flash: as pendentes ficam na sessão para a próxima página que as mostra.
+    """
+    if request.method not in ('GET', 'HEAD'): return None, None
+    etag = hashlib.sha1(repr(versions).encode()).hexdigest()[:20]
+    return etag, with_etag(Response(status=304), etag) if request.if_none_match.contains_weak(etag) else None
+
+def with_etag(response, etag):
+    """Marca a resposta com o ETag (fraco, pois o corpo pode sair comprimido) e pede revalidação a cada uso."""
+    response = make_response(response)
+    if etag:
+        response.set_etag(etag, weak=True); response.cache_control.private = True; response.cache_control.no_cache = True
+    return response
+
+def touch_company(company_id):
+    """Marca a empresa como alterada quando some algo que ela exibe (produto ou avaliação excluídos), na transação atual."""
+    Company.query.filter_by(id=company_id).update({Company.updated_at: datetime.utcnow()}, synchronize_session=False)
+
+def catalog_version():
+    """Última alteração de produtos, empresas e avaliações (exclusões tocam a empresa): versão do marketplace."""
+    return (db.session.query(func.max(Product.updated_at)).scalar(), db.session.query(func.max(Company.updated_at)).scalar(),
+            db.session.query(func.max(Review.updated_at)).scalar())
+
 # --- Modelos do Banco de Dados ---
 class Company(db.Model):
+    __table_args__ = (db.Index('ix_company_name_id', 'company_name', 'id'), db.Index('ix_company_updated_at', 'updated_at'))
     id = db.Column(db.Integer, primary_key=True); company_name = db.Column(db.String(150), nullable=False); cnpj = db.Column(db.String(18), unique=True, nullable=False); email = db.Column(db.String(150), unique=True, nullable=False); password_hash = db.Column(db.String(256), nullable=False); user_type = db.Column(db.String(50), nullable=False)
     is_verified = db.Column(db.Boolean, default=False); is_admin = db.Column(db.Boolean, default=False); is_active = db.Column(db.Boolean, default=True)
     logo_filename = db.Column(db.String(255), nullable=True); description = db.Column(db.Text, nullable=True); website = db.Column(db.String(255), nullable=True); address = db.Column(db.String(255), nullable=True); certifications = db.Column(db.String(255), nullable=True)
+    logo_variants = db.Column(db.Text, nullable=True) # JSON: variantes do logo (ver generate_image_variants)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False) # Também tocado por touch_company (ver ETags)
     products = db.relationship('Product', backref='supplier', lazy=True, cascade="all, delete-orphan")
     notifications = db.relationship('Notification', foreign_keys='Notification.recipient_id', backref='recipient', lazy=True, cascade="all, delete-orphan")
     reviews_received = db.relationship('Review', foreign_keys='Review.supplier_id', backref='reviewed_supplier', lazy='dynamic')
@@ -123,14 +668,21 @@ class Company(db.Model):
     def check_password(self,p): return check_password_hash(self.password_hash,p)
 
 class Product(db.Model):
+    __table_args__ = (db.Index('ix_product_supplier_sku', 'supplier_id', 'sku', unique=True), db.Index('ix_product_updated_at', 'updated_at'))
     id = db.Column(db.Integer, primary_key=True); name = db.Column(db.String(100), nullable=False); description = db.Column(db.Text, nullable=False); category = db.Column(db.String(80), nullable=False); base_price = db.Column(db.Float, nullable=True); supplier_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    sku = db.Column(db.String(64), nullable=True) # Código do fornecedor; chave da importação de catálogo
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False) # Também muda com as imagens (ver ETags)
     images = db.relationship('ProductImage', backref='product', lazy=True, cascade="all, delete-orphan")
     quote_requests = db.relationship('QuoteRequest', backref='product', lazy=True, cascade="all, delete-orphan")
 
 class ProductImage(db.Model):
     id = db.Column(db.Integer, primary_key=True); filename = db.Column(db.String(255), nullable=False); product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    variants = db.Column(db.Text, nullable=True) # JSON: miniaturas WebP/AVIF (ver generate_image_variants); nulo até o worker gerar
 
 class QuoteRequest(db.Model):
+    __table_args__ = (db.Index('ix_quote_request_supplier_timestamp', 'supplier_id', 'timestamp', 'id'), db.Index('ix_quote_request_group_id', 'group_id'),
+                      db.Index('ix_quote_request_timestamp_id', 'timestamp', 'id'), db.Index('ix_quote_request_status_timestamp', 'status', 'timestamp', 'id'),
+                      db.Index('ix_quote_request_attachment_filename', 'attachment_filename'), db.Index('ix_quote_request_buyer_timestamp', 'buyer_id', 'timestamp', 'id'))
     id = db.Column(db.Integer, primary_key=True); quantity = db.Column(db.Integer, nullable=False); message = db.Column(db.Text, nullable=True); status = db.Column(db.String(50), nullable=False, default='Pendente'); timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False); buyer_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False); supplier_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     offered_price = db.Column(db.Float, nullable=True); supplier_message = db.Column(db.Text, nullable=True); response_timestamp = db.Column(db.DateTime, nullable=True)
@@ -140,19 +692,24 @@ class QuoteRequest(db.Model):
     chat_messages = db.relationship('ChatMessage', backref='quote', lazy=True, cascade="all, delete-orphan")
 
 class QuoteGroup(db.Model):
+    __table_args__ = (db.Index('ix_quote_group_buyer_timestamp', 'buyer_id', 'timestamp', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # chave da paginação por cursor (keyset_page)
     buyer_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     quotes = db.relationship('QuoteRequest', backref='group', lazy='dynamic')
 
 class Notification(db.Model):
-    id = db.Column(db.Integer, primary_key=True); message = db.Column(db.String(255), nullable=False); link = db.Column(db.String(255), nullable=True); timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow); read = db.Column(db.Boolean, default=False); recipient_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    __table_args__ = (db.Index('ix_notification_recipient_read', 'recipient_id', 'read'), db.Index('ix_notification_recipient_timestamp', 'recipient_id', 'timestamp', 'id'))
+    id = db.Column(db.Integer, primary_key=True); message = db.Column(db.String(255), nullable=False); link = db.Column(db.String(255), nullable=True); timestamp = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow); read = db.Column(db.Boolean, default=False); recipient_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
 
 class Review(db.Model):
+    __table_args__ = (db.Index('ix_review_timestamp_id', 'timestamp', 'id'), db.Index('ix_review_updated_at', 'updated_at'), db.Index('ix_review_supplier_updated', 'supplier_id', 'updated_at'))
     id = db.Column(db.Integer, primary_key=True); rating = db.Column(db.Integer, nullable=False); comment = db.Column(db.Text, nullable=True); timestamp = db.Column(db.DateTime, default=datetime.utcnow); quote_id = db.Column(db.Integer, db.ForeignKey('quote_request.id'), unique=True, nullable=False); reviewer_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False); supplier_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False) # Também muda quando o avaliador troca de nome
 
 class ChatMessage(db.Model):
+    __table_args__ = (db.Index('ix_chat_message_quote_timestamp', 'quote_id', 'timestamp', 'id'), db.Index('ix_chat_message_attachment_filename', 'attachment_filename'))
     id = db.Column(db.Integer, primary_key=True); message = db.Column(db.Text, nullable=True); timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False); quote_id = db.Column(db.Integer, db.ForeignKey('quote_request.id'), nullable=False); sender_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
     attachment_filename = db.Column(db.String(255), nullable=True) # Campo para anexo
     attachment_type = db.Column(db.String(50), nullable=True) # Tipo do anexo (imagem, pdf, etc.)
@@ -188,6 +745,679 @@ class Announcement(db.Model):
     is_active = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+class SupplierRating(db.Model):
+    """Agregado das avaliações de um fornecedor, atualizado junto com cada avaliação criada ou removida."""
+    supplier_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0) # Histograma: quantidade de notas 1..5
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    rating_avg = db.Column(db.Float, nullable=True, index=True) # rating_sum / rating_count (filtro do marketplace)
+
+class CompanyStats(db.Model):
+    """Números do painel de cada empresa, atualizados a cada mudança de status das suas cotações."""
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    quotes_pending = db.Column(db.Integer, nullable=False, default=0)
+    quotes_responded = db.Column(db.Integer, nullable=False, default=0)
+    quotes_accepted = db.Column(db.Integer, nullable=False, default=0)
+    quotes_declined = db.Column(db.Integer, nullable=False, default=0)
+    gmv = db.Column(db.Float, nullable=False, default=0) # Soma de preço ofertado x quantidade das cotações aceitas
+    response_histogram = db.Column(db.Text, nullable=True) # JSON: respostas por faixa de RESPONSE_TIME_BUCKETS
+    median_response_seconds = db.Column(db.Float, nullable=True)
+    @property
+    def total_quotes(self): return self.quotes_pending + self.quotes_responded + self.quotes_accepted + self.quotes_declined
+    @property
+    def acceptance_rate(self): return (self.quotes_accepted / self.total_quotes * 100) if self.total_quotes > 0 else 0
+
+class ExportJob(db.Model):
+    """Relatório pedido por uma empresa e gerado pelo worker (run_export_job); o arquivo expira após EXPORT_FILE_TTL."""
+    __table_args__ = (db.Index('ix_export_job_company_created', 'company_id', 'created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    report = db.Column(db.String(30), nullable=False) # Chave de EXPORT_REPORTS
+    file_format = db.Column(db.String(10), nullable=False) # csv, xlsx ou parquet
+    filters = db.Column(db.Text, nullable=False) # JSON: date_from, date_to, status
+    status = db.Column(db.String(20), nullable=False, default='Na fila') # Na fila, Gerando, Concluído, Falhou, Expirado
+    progress = db.Column(db.Integer, nullable=False, default=0) # Linhas já escritas
+    total_rows = db.Column(db.Integer, nullable=True)
+    filename = db.Column(db.String(255), nullable=True) # Arquivo em EXPORT_FOLDER
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    @property
+    def percent(self): return 100 if self.status == 'Concluído' else int(self.progress * 100 / self.total_rows) if self.total_rows else 0
+
+class ImportJob(db.Model):
+    """Importação de catálogo (planilha + zip de imagens opcional) enviada por um fornecedor e feita pelo worker (run_catalog_import)."""
+    __table_args__ = (db.Index('ix_import_job_company_created', 'company_id', 'created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=True) # Planilha em IMPORT_FOLDER (apagada ao terminar)
+    images_filename = db.Column(db.String(255), nullable=True) # Zip de imagens em IMPORT_FOLDER (apagado ao terminar)
+    status = db.Column(db.String(20), nullable=False, default='Na fila') # Na fila, Processando, Concluído, Falhou
+    total_rows = db.Column(db.Integer, nullable=True)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    created_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True) # JSON: [{'row', 'sku', 'errors'}], até IMPORT_MAX_ERRORS linhas
+    error = db.Column(db.String(255), nullable=True) # Falha que interrompeu a importação
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    @property
+    def percent(self): return 100 if self.status == 'Concluído' else int(self.processed_rows * 100 / self.total_rows) if self.total_rows else 0
+    @property
+    def error_rows(self): return json.loads(self.errors or '[]')
+
+# --- Agregado de Avaliações dos Fornecedores ---
+def update_supplier_rating(supplier_id, rating, delta):
+    """Soma (delta=+n) ou retira (delta=-n) n notas iguais do agregado do fornecedor, na transação atual."""
+    bucket = getattr(SupplierRating, f'rating_{rating}')
+    new_count = SupplierRating.rating_count + delta; new_sum = SupplierRating.rating_sum + delta * rating
+    updated = SupplierRating.query.filter_by(supplier_id=supplier_id).update({
+        SupplierRating.rating_count: new_count, SupplierRating.rating_sum: new_sum, bucket: bucket + delta,
+        SupplierRating.rating_avg: case((new_count > 0, db.cast(new_sum, db.Float) / new_count), else_=None),
+    }, synchronize_session=False)
+    if not updated and delta > 0:
+        db.session.add(SupplierRating(supplier_id=supplier_id, rating_count=delta, rating_sum=delta * rating, rating_avg=float(rating), **{f'rating_{rating}': delta}))
+
+def supplier_avg_ratings(supplier_ids):
+    """{supplier_id: média} para os fornecedores informados (0 para quem não tem avaliações)."""
+    rows = db.session.query(SupplierRating.supplier_id, SupplierRating.rating_avg).filter(SupplierRating.supplier_id.in_(supplier_ids)).all()
+    averages = {supplier_id: 0 for supplier_id in supplier_ids}
+    averages.update({row.supplier_id: row.rating_avg or 0 for row in rows})
+    return averages
+
+# --- Notificações ---
+def unread_notification_count(company_id):
+    """Número de notificações não lidas, do cache; consulta o banco só quando não há valor em cache."""
+    count = unread_counter.get(company_id)
+    if count is None:
+        count = Notification.query.filter_by(recipient_id=company_id, read=False).count()
+        unread_counter.set(company_id, count)
+    return count
+
+def notification_page(company_id, cursor=None):
+    """Uma página do feed de notificações (mais recentes primeiro) e o cursor da próxima, se houver."""
+    query = Notification.query.filter_by(recipient_id=company_id)
+    return keyset_page(query, Notification.timestamp, Notification.id, cursor, app.config['NOTIFICATIONS_PAGE_SIZE'])
+
+def dispatch_notifications(notifications):
+    """
+    Cria as notificações [(recipient_id, mensagem, link)] com um único INSERT e faz o commit
+    (junto com as alterações já pendentes na sessão). Em seguida atualiza o número de não lidas
+    de cada destinatário (os que não estão em cache saem de uma única consulta agrupada) e emite
+    'new_notification' uma vez por destinatário. Retorna {recipient_id: não lidas}.
+    """
+    if notifications:
+        db.session.execute(insert(Notification), [{'recipient_id': recipient_id, 'message': message, 'link': link} for recipient_id, message, link in notifications])
+    db.session.commit()
+    if not notifications: return {}
+    counts = unread_counter.incr_many(Counter(recipient_id for recipient_id, _, _ in notifications))
+    missing = [recipient_id for recipient_id, count in counts.items() if count is None]
+    if missing:
+        rows = (db.session.query(Notification.recipient_id, func.count(Notification.id)).filter(Notification.recipient_id.in_(missing), Notification.read == False)
+                .group_by(Notification.recipient_id).all())
+        counts.update(dict.fromkeys(missing, 0)); counts.update(dict(rows))
+        for recipient_id in missing: unread_counter.set(recipient_id, counts[recipient_id])
+    for recipient_id, count in counts.items():
+        socketio.emit('new_notification', {'unread_count': count}, room=f"user_{recipient_id}")
+    return counts
+
+# --- Estatísticas do Painel ---
+QUOTE_STATUS_COLUMNS = {'Pendente': 'quotes_pending', 'Respondido': 'quotes_responded', 'Aceito': 'quotes_accepted', 'Recusado': 'quotes_declined'}
+# Limites superiores (em segundos) das faixas de tempo de resposta; a última faixa é "acima de 30 dias"
+RESPONSE_TIME_BUCKETS = [60, 300, 900, 1800, 3600, 7200, 14400, 28800, 43200, 86400, 172800, 259200, 604800, 1209600, 2592000]
+
+def _histogram_median(histogram):
+    """Mediana aproximada (interpolada dentro da faixa) de um histograma de tempos de resposta."""
+    total = sum(histogram)
+    if not total: return None
+    position = total / 2; seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= position:
+            low = RESPONSE_TIME_BUCKETS[i - 1] if i > 0 else 0
+            high = RESPONSE_TIME_BUCKETS[i] if i < len(RESPONSE_TIME_BUCKETS) else low
+            return low + (high - low) * (position - seen) / count
+        seen += count
+
+def _response_histogram_add(histogram, seconds):
+    histogram = histogram or [0] * (len(RESPONSE_TIME_BUCKETS) + 1)
+    histogram[bisect.bisect_left(RESPONSE_TIME_BUCKETS, max(seconds, 0))] += 1
+    return histogram
+
+def build_company_stats(company_id):
+    """Calcula do zero as estatísticas de uma empresa a partir das cotações (usado na primeira leitura e no rebuild)."""
+    involved = or_(QuoteRequest.buyer_id == company_id, QuoteRequest.supplier_id == company_id)
+    stats = CompanyStats(company_id=company_id, quotes_pending=0, quotes_responded=0, quotes_accepted=0, quotes_declined=0, gmv=0)
+    for status, count in db.session.query(QuoteRequest.status, func.count(QuoteRequest.id)).filter(involved).group_by(QuoteRequest.status).all():
+        if status in QUOTE_STATUS_COLUMNS: setattr(stats, QUOTE_STATUS_COLUMNS[status], count)
+    stats.gmv = db.session.query(func.sum(QuoteRequest.offered_price * QuoteRequest.quantity)).filter(involved, QuoteRequest.status == 'Aceito').scalar() or 0
+    histogram = None
+    responses = db.session.query(QuoteRequest.timestamp, QuoteRequest.response_timestamp).filter(QuoteRequest.supplier_id == company_id, QuoteRequest.response_timestamp.isnot(None))
+    for requested_at, responded_at in responses.yield_per(1000):
+        histogram = _response_histogram_add(histogram, (responded_at - requested_at).total_seconds())
+    if histogram: stats.response_histogram = json.dumps(histogram); stats.median_response_seconds = _histogram_median(histogram)
+    db.session.add(stats)
+    return stats
+
+def get_company_stats(company_id):
+    """Estatísticas do painel (uma leitura por chave primária; calculadas e gravadas na primeira vez)."""
+    stats = db.session.get(CompanyStats, company_id)
+    if stats is None:
+        stats = build_company_stats(company_id); db.session.commit()
+    return stats
+
+def update_company_stats(company_id, status_deltas, gmv=0, response_seconds=None):
+    """
+    Aplica variações às estatísticas de uma empresa, na transação atual.
+    status_deltas: {status: +n/-n}; gmv: valor a somar; response_seconds: tempo de uma nova resposta.
+    """
+    db.session.flush()
+    stats = db.session.get(CompanyStats, company_id, with_for_update=True, populate_existing=True)
+    if stats is None: build_company_stats(company_id); return # O cálculo completo já inclui a alteração
+    for status, delta in status_deltas.items():
+        column = QUOTE_STATUS_COLUMNS.get(status)
+        if column and delta: setattr(stats, column, getattr(CompanyStats, column) + delta)
+    if gmv: stats.gmv = CompanyStats.gmv + gmv
+    if response_seconds is not None:
+        histogram = _response_histogram_add(json.loads(stats.response_histogram) if stats.response_histogram else None, response_seconds)
+        stats.response_histogram = json.dumps(histogram); stats.median_response_seconds = _histogram_median(histogram)
+
+def record_quote_status_change(quote, old_status):
+    """Atualiza as estatísticas do comprador e do fornecedor depois que 'quote.status' mudou de 'old_status'."""
+    if old_status == quote.status: return
+    deltas = {quote.status: 1}
+    if old_status: deltas[old_status] = -1
+    quote_value = (quote.offered_price or 0) * quote.quantity
+    gmv = quote_value if quote.status == 'Aceito' else -quote_value if old_status == 'Aceito' else 0
+    response_seconds = (quote.response_timestamp - quote.timestamp).total_seconds() if old_status == 'Pendente' and quote.status == 'Respondido' else None
+    update_company_stats(quote.buyer_id, deltas, gmv)
+    update_company_stats(quote.supplier_id, deltas, gmv, response_seconds)
+
+def forget_product_quotes_stats(product_id):
+    """Retira das estatísticas as cotações de um produto que será excluído (elas são apagadas em cascata)."""
+    quote_value = func.coalesce(func.sum(QuoteRequest.offered_price * QuoteRequest.quantity), 0)
+    rows = db.session.query(QuoteRequest.buyer_id, QuoteRequest.supplier_id, QuoteRequest.status, func.count(QuoteRequest.id), quote_value).filter(QuoteRequest.product_id == product_id).group_by(QuoteRequest.buyer_id, QuoteRequest.supplier_id, QuoteRequest.status).all()
+    # Quem ainda não tem estatísticas ganha a linha calculada agora, com as cotações ainda no banco, para que as
+    # variações abaixo as retirem (update_company_stats calcularia a linha sem aplicar a variação)
+    company_ids = {company_id for buyer_id, supplier_id, *_ in rows for company_id in (buyer_id, supplier_id)}
+    existing = {company_id for company_id, in db.session.query(CompanyStats.company_id).filter(CompanyStats.company_id.in_(company_ids))} if company_ids else set()
+    for company_id in company_ids - existing: build_company_stats(company_id)
+    for buyer_id, supplier_id, status, count, value in rows:
+        gmv = -value if status == 'Aceito' else 0
+        for company_id in (buyer_id, supplier_id): update_company_stats(company_id, {status: -count}, gmv)
+
+# --- Busca Textual de Produtos ---
+# SQLite: tabela virtual FTS5 'product_fts' (rowid = product.id) com os radicais das palavras,
+# mantida pelas rotas que gravam produtos. PostgreSQL: índice GIN funcional sobre
+# to_tsvector('pt_unaccent', ...), mantido pelo próprio banco. Ambos criados pela migração.
+PG_SEARCH_CONFIG = literal_column("'pt_unaccent'")
+
+def sync_product_search(product):
+    """Grava (ou regrava) o produto no índice FTS5. Deve ser chamada após o flush do produto."""
+    if db.engine.dialect.name != 'sqlite': return
+    db.session.execute(text("DELETE FROM product_fts WHERE rowid = :id"), {'id': product.id})
+    db.session.execute(text("INSERT INTO product_fts (rowid, name, description) VALUES (:id, :name, :description)"),
+                       {'id': product.id, 'name': search_document(product.name), 'description': search_document(product.description)})
+
+def sync_products_search(product_ids):
+    """Regrava no índice FTS5 vários produtos de uma vez (ex.: ao fim de uma importação de catálogo)."""
+    if db.engine.dialect.name != 'sqlite': return
+    delete = text("DELETE FROM product_fts WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True))
+    insert_fts = text("INSERT INTO product_fts (rowid, name, description) VALUES (:id, :name, :description)")
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        db.session.execute(delete, {'ids': chunk})
+        rows = db.session.query(Product.id, Product.name, Product.description).filter(Product.id.in_(chunk))
+        db.session.execute(insert_fts, [{'id': r.id, 'name': search_document(r.name), 'description': search_document(r.description)} for r in rows])
+
+def remove_product_search(product_id):
+    """Remove o produto do índice FTS5."""
+    if db.engine.dialect.name != 'sqlite': return
+    db.session.execute(text("DELETE FROM product_fts WHERE rowid = :id"), {'id': product_id})
+
+def apply_product_search(query, search_query):
+    """
+    Restringe 'query' (sobre Product) aos produtos que casam com a busca e
+    retorna (query, coluna de relevância), onde menor = mais relevante.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        tsquery_str = tsquery_expression(search_query)
+        if not tsquery_str: return query, None
+        document = func.to_tsvector(PG_SEARCH_CONFIG, func.coalesce(Product.name, '') + literal_column("' '") + func.coalesce(Product.description, ''))
+        tsquery = func.to_tsquery(PG_SEARCH_CONFIG, tsquery_str)
+        weighted = func.setweight(func.to_tsvector(PG_SEARCH_CONFIG, func.coalesce(Product.name, '')), 'A').op('||')(func.setweight(func.to_tsvector(PG_SEARCH_CONFIG, func.coalesce(Product.description, '')), 'B'))
+        return query.filter(document.op('@@')(tsquery)), -func.ts_rank(weighted, tsquery)
+    match = fts5_match_expression(search_query)
+    if not match: return query, None
+    # 'rank' do FTS5 usa bm25 com peso 10 para o nome e 1 para a descrição (configurado na migração)
+    product_fts = table('product_fts', column('rowid'), column('rank'))
+    matches = db.session.query(product_fts.c.rowid.label('product_id'), product_fts.c.rank.label('rank')).filter(literal_column('product_fts').op('MATCH')(match)).subquery()
+    return query.join(matches, Product.id == matches.c.product_id), matches.c.rank
+
+# --- Índice de Autocompletar ---
+# Cada processo mantém seu próprio índice. Com vários processos, quem altera um produto
+# incrementa a versão no Redis; os demais comparam a versão a cada
+# AUTOCOMPLETE_SYNC_INTERVAL segundos e reconstroem o índice se ela mudou.
+autocomplete_index = PrefixIndex()
+AUTOCOMPLETE_VERSION_KEY = 'autocomplete:version'
+_autocomplete_sync = {'version': None, 'checked_at': 0.0}
+
+def _autocomplete_remote_version():
+    client = get_redis()
+    if client is None: return None
+    try: return int(client.get(AUTOCOMPLETE_VERSION_KEY) or 0)
+    except redis.RedisError as e: app.logger.warning(f"Autocompletar: Redis indisponível ({e})"); return None
+
+def load_autocomplete_index():
+    """Reconstrói o índice a partir do banco (nomes + número de cotações por produto)."""
+    version = _autocomplete_remote_version()
+    popularity = db.session.query(QuoteRequest.product_id, func.count(QuoteRequest.id)).group_by(QuoteRequest.product_id).all()
+    autocomplete_index.build(db.session.query(Product.id, Product.name).all(), popularity)
+    _autocomplete_sync.update(version=version, checked_at=time.monotonic())
+
+def ensure_autocomplete_index():
+    if not autocomplete_index.built: load_autocomplete_index(); return
+    if time.monotonic() - _autocomplete_sync['checked_at'] < app.config['AUTOCOMPLETE_SYNC_INTERVAL']: return
+    _autocomplete_sync['checked_at'] = time.monotonic()
+    version = _autocomplete_remote_version()
+    if version is not None and version != _autocomplete_sync['version']: load_autocomplete_index()
+
+def invalidate_autocomplete_index():
+    """Avisa os outros processos de que os produtos mudaram."""
+    client = get_redis()
+    if client is None: return
+    try: version = client.incr(AUTOCOMPLETE_VERSION_KEY)
+    except redis.RedisError as e: app.logger.warning(f"Autocompletar: Redis indisponível ({e})"); return
+    # Se ninguém mais alterou produtos desde a última verificação, nosso índice já está em dia
+    if _autocomplete_sync['version'] is not None and version == _autocomplete_sync['version'] + 1: _autocomplete_sync['version'] = version
+
+# Chamadas depois do commit de um produto: atualizam os índices e caches em memória
+def product_saved(product):
+    if autocomplete_index.built: autocomplete_index.add(product.id, product.name)
+    invalidate_autocomplete_index()
+    fragment_cache.delete('product', product.id)
+    invalidate_marketplace_facets()
+
+def product_deleted(product_id):
+    if autocomplete_index.built: autocomplete_index.remove(product_id)
+    invalidate_autocomplete_index()
+    invalidate_marketplace_facets()
+    fragment_cache.delete('product', product_id)
+
+def company_changed(company):
+    """Chamada depois do commit de uma alteração no perfil: o nome e o selo aparecem no cabeçalho, nos cartões dos produtos e nas avaliações que a empresa fez."""
+    fragment_cache.delete('supplier_header', company.id)
+    fragment_cache.delete('product', *[row.id for row in db.session.query(Product.id).filter_by(supplier_id=company.id)])
+    fragment_cache.delete('reviews', *[row.supplier_id for row in db.session.query(Review.supplier_id).filter_by(reviewer_id=company.id).distinct()])
+
+def supplier_reviews_changed(supplier_id):
+    """Chamada depois do commit de uma avaliação nova ou removida: muda a lista e a média do fornecedor."""
+    fragment_cache.delete('reviews', supplier_id); fragment_cache.delete('supplier_header', supplier_id)
+    invalidate_marketplace_facets()
+
+# --- Variantes das Imagens (miniaturas WebP/AVIF) ---
+image_logger = get_task_logger('connecta.images')
+IMAGE_VARIANTS_DIR = 'variants' # subpasta de UPLOAD_FOLDER
+
+def image_variant_formats():
+    # AVIF primeiro: o navegador usa a primeira <source> que suportar
+    return ['avif', 'webp'] if pil_features.check('avif') else ['webp']
+
+def generate_image_variants(filename):
+    """
+    Gera uploads/variants/<hash>_<largura>.<formato> para cada largura de IMAGE_VARIANT_WIDTHS (sem ampliar
+    a imagem). O nome leva o hash do conteúdo, então o mesmo arquivo enviado de novo reaproveita as variantes.
+    Retorna [{'format', 'width', 'filename'}].
+    """
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    with open(path, 'rb') as f: digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    target_dir = os.path.join(app.config['UPLOAD_FOLDER'], IMAGE_VARIANTS_DIR); os.makedirs(target_dir, exist_ok=True)
+    variants = []
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'): image = image.convert('RGBA' if image.mode in ('P', 'LA', 'PA') else 'RGB')
+        for width in sorted({min(w, image.width) for w in app.config['IMAGE_VARIANT_WIDTHS']}):
+            resized = image if width == image.width else image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for fmt in image_variant_formats():
+                name = f"{digest}_{width}.{fmt}"
+                if not os.path.exists(os.path.join(target_dir, name)):
+                    resized.save(os.path.join(target_dir, name), fmt.upper(), quality=app.config['IMAGE_VARIANT_QUALITY'])
+                variants.append({'format': fmt, 'width': width, 'filename': f"{IMAGE_VARIANTS_DIR}/{name}"})
+    return variants
+
+@celery.task
+def process_image(kind, record_id):
+    """Gera as variantes de uma imagem de produto ('product_image') ou de um logo ('logo') e grava no registro."""
+    if Image is None: image_logger.warning("Pillow não instalado: variantes de imagem não geradas"); return
+    record = db.session.get(ProductImage if kind == 'product_image' else Company, record_id)
+    filename = (record.filename if kind == 'product_image' else record.logo_filename) if record else None
+    if not filename: return
+    try: variants = json.dumps(generate_image_variants(filename))
+    except (OSError, Image.DecompressionBombError) as e: image_logger.error(f"Imagem {filename} ignorada: {e}"); return
+    db.session.refresh(record)
+    if kind == 'product_image':
+        record.variants = variants
+        Product.query.filter_by(id=record.product_id).update({Product.updated_at: datetime.utcnow()}, synchronize_session=False)
+    elif record.logo_filename == filename: record.logo_variants = variants # o logo pode ter sido trocado enquanto processava
+    db.session.commit()
+    # Roda no worker: a invalidação só chega aos processos web com REDIS_URL (sem ele, os fragmentos vencem pela validade)
+    if kind == 'logo': fragment_cache.delete('supplier_header', record.id)
+    else: fragment_cache.delete('product', record.product_id)
+
+@app.template_global()
+def image_srcsets(variants):
+    """{formato: srcset} a partir do JSON de variantes; vazio enquanto o worker não as gerou."""
+    srcsets = {}
+    for variant in json.loads(variants) if variants else []:
+        srcsets.setdefault(variant['format'], []).append(f"{url_for('static', filename='uploads/' + variant['filename'])} {variant['width']}w")
+    return {fmt: ', '.join(items) for fmt, items in srcsets.items()}
+
+# --- Relatórios em Segundo Plano (Celery) ---
+export_logger = get_task_logger('connecta.exports')
+
+def apply_report_filters(query, timestamp_column, status_column, filters):
+    if filters.get('date_from'): query = query.filter(timestamp_column >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+    if filters.get('date_to'): query = query.filter(timestamp_column < datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1))
+    if filters.get('status') and status_column is not None: query = query.filter(status_column == filters['status'])
+    return query
+
+def quotes_report_query(company, filters):
+    buyer = aliased(Company); supplier = aliased(Company)
+    owner_column = QuoteRequest.buyer_id if company.user_type == 'buyer' else QuoteRequest.supplier_id
+    query = (db.session.query(QuoteRequest.id, Product.name.label('product_name'), QuoteRequest.status, QuoteRequest.quantity, QuoteRequest.offered_price, QuoteRequest.delivery_date,
+                              buyer.company_name.label('buyer_name'), supplier.company_name.label('supplier_name'), QuoteRequest.timestamp)
+             .join(Product, QuoteRequest.product_id == Product.id).join(buyer, QuoteRequest.buyer_id == buyer.id).join(supplier, QuoteRequest.supplier_id == supplier.id)
+             .filter(owner_column == company.id))
+    return apply_report_filters(query, QuoteRequest.timestamp, QuoteRequest.status, filters), QuoteRequest.id
+
+def rfq_responses_report_query(company, filters):
+    buyer = aliased(Company); supplier = aliased(Company)
+    owner_column = OpenRFQ.buyer_id if company.user_type == 'buyer' else OpenRFQResponse.supplier_id
+    query = (db.session.query(OpenRFQResponse.id, OpenRFQ.title.label('rfq_title'), OpenRFQ.status, OpenRFQResponse.price, OpenRFQResponse.delivery_date, OpenRFQResponse.message,
+                              buyer.company_name.label('buyer_name'), supplier.company_name.label('supplier_name'), OpenRFQResponse.timestamp)
+             .join(OpenRFQ, OpenRFQResponse.rfq_id == OpenRFQ.id).join(buyer, OpenRFQ.buyer_id == buyer.id).join(supplier, OpenRFQResponse.supplier_id == supplier.id)
+             .filter(owner_column == company.id))
+    return apply_report_filters(query, OpenRFQResponse.timestamp, OpenRFQ.status, filters), OpenRFQResponse.id
+
+def reviews_report_query(company, filters):
+    reviewer = aliased(Company); supplier = aliased(Company)
+    owner_column = Review.reviewer_id if company.user_type == 'buyer' else Review.supplier_id
+    query = (db.session.query(Review.id, Product.name.label('product_name'), Review.rating, Review.comment,
+                              reviewer.company_name.label('reviewer_name'), supplier.company_name.label('supplier_name'), Review.timestamp)
+             .join(QuoteRequest, Review.quote_id == QuoteRequest.id).join(Product, QuoteRequest.product_id == Product.id)
+             .join(reviewer, Review.reviewer_id == reviewer.id).join(supplier, Review.supplier_id == supplier.id)
+             .filter(owner_column == company.id))
+    return apply_report_filters(query, Review.timestamp, None, filters), Review.id
+
+# Cada relatório: função que monta a consulta (colunas projetadas, sem ordenação; retorna também a coluna de id
+# usada na paginação) e as colunas do arquivo (título, campo, tipo)
+EXPORT_REPORTS = {
+    'quotes': {'title': 'Cotações', 'query': quotes_report_query, 'statuses': QUOTE_STATUSES, 'columns': [
+        ('ID', 'id', 'int'), ('Produto', 'product_name', 'str'), ('Status', 'status', 'str'), ('Qtd', 'quantity', 'int'), ('Preço Ofertado', 'offered_price', 'float'),
+        ('Entrega', 'delivery_date', 'date'), ('Comprador', 'buyer_name', 'str'), ('Fornecedor', 'supplier_name', 'str'), ('Data', 'timestamp', 'datetime')]},
+    'rfq_responses': {'title': 'Respostas a RFQs', 'query': rfq_responses_report_query, 'statuses': ('Aberto', 'Fechado'), 'columns': [
+        ('ID', 'id', 'int'), ('RFQ', 'rfq_title', 'str'), ('Status do RFQ', 'status', 'str'), ('Preço', 'price', 'float'), ('Entrega', 'delivery_date', 'date'),
+        ('Mensagem', 'message', 'str'), ('Comprador', 'buyer_name', 'str'), ('Fornecedor', 'supplier_name', 'str'), ('Data', 'timestamp', 'datetime')]},
+    'reviews': {'title': 'Avaliações', 'query': reviews_report_query, 'statuses': (), 'columns': [
+        ('ID', 'id', 'int'), ('Produto', 'product_name', 'str'), ('Nota', 'rating', 'int'), ('Comentário', 'comment', 'str'),
+        ('Avaliador', 'reviewer_name', 'str'), ('Fornecedor', 'supplier_name', 'str'), ('Data', 'timestamp', 'datetime')]},
+}
+
+def report_values(rows, columns):
+    """Valores de cada linha na ordem de 'columns', lidos por posição (bem mais rápido que getattr em milhões de linhas)."""
+    positions = [rows[0]._fields.index(key) for _, key, _ in columns]
+    return ([row[i] for i in positions] for row in rows)
+
+class CSVReportWriter:
+    extension = 'csv'; available = True
+    def __init__(self, path, columns):
+        self.columns = columns; self.file = open(path, 'w', newline='', encoding='utf-8'); self.writer = csv.writer(self.file)
+        self.writer.writerow([title for title, _, _ in columns])
+        self.dates = [i for i, (_, _, kind) in enumerate(columns) if kind in ('date', 'datetime')]
+    def write(self, rows):
+        for values in report_values(rows, self.columns):
+            for i in self.dates:
+                if values[i] is not None: values[i] = values[i].isoformat(' ', 'seconds') if isinstance(values[i], datetime) else values[i].isoformat()
+            self.writer.writerow(values)
+    def close(self): self.file.close()
+
+class XLSXReportWriter:
+    """Planilha em modo write_only do openpyxl: as linhas vão direto para o arquivo, sem ficar na memória."""
+    extension = 'xlsx'; available = openpyxl is not None
+    def __init__(self, path, columns):
+        self.path = path; self.columns = columns
+        self.workbook = openpyxl.Workbook(write_only=True); self.sheet = self.workbook.create_sheet('Relatório')
+        self.sheet.append([title for title, _, _ in columns])
+    def write(self, rows):
+        for values in report_values(rows, self.columns): self.sheet.append(values)
+    def close(self): self.workbook.save(self.path)
+
+class ParquetReportWriter:
+    """Parquet colunar com esquema fixo; cada lote lido do banco vira um row group."""
+    extension = 'parquet'; available = pa is not None
+    def __init__(self, path, columns):
+        types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'date': pa.date32(), 'datetime': pa.timestamp('us')}
+        self.columns = columns; self.schema = pa.schema([(key, types[kind]) for _, key, kind in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+    def write(self, rows):
+        self.writer.write_table(pa.Table.from_pylist([dict(zip(self.schema.names, values)) for values in report_values(rows, self.columns)], schema=self.schema))
+    def close(self): self.writer.close()
+
+REPORT_WRITERS = {'csv': CSVReportWriter, 'xlsx': XLSXReportWriter, 'parquet': ParquetReportWriter}
+def export_formats(): return [fmt for fmt, writer in REPORT_WRITERS.items() if writer.available]
+
+def export_job_payload(job):
+    return {'id': job.id, 'status': job.status, 'progress': job.progress, 'total_rows': job.total_rows, 'percent': job.percent, 'error': job.error,
+            'download_url': url_for('download_export', job_id=job.id) if job.status == 'Concluído' else None}
+
+def export_stale_cutoff():
+    """Pedidos em 'Na fila'/'Gerando' criados antes disto são considerados abandonados."""
+    return datetime.utcnow() - timedelta(seconds=app.config['EXPORT_STALE_AFTER'])
+
+@celery.task
+def run_export_job(job_id):
+    """
+    Gera o arquivo de um ExportJob lendo o banco em lotes de EXPORT_BATCH_SIZE (paginação pelo id: o timestamp
+    pode ser nulo e faria a comparação por tupla parar no meio), grava o progresso (até uma vez por segundo) e avisa
+    a empresa na sala user_<id> do Socket.IO quando termina. Qualquer falha deixa o pedido como 'Falhou'.
+    """
+    job = db.session.get(ExportJob, job_id)
+    if job is None or job.status != 'Na fila': return
+    path = None
+    try:
+        report = EXPORT_REPORTS[job.report]
+        query, id_column = report['query'](db.session.get(Company, job.company_id), json.loads(job.filters))
+        job.status = 'Gerando'; job.total_rows = query.count(); db.session.commit()
+        os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
+        filename = f"relatorio_{job.report}_{job.id}.{REPORT_WRITERS[job.file_format].extension}"
+        path = os.path.join(app.config['EXPORT_FOLDER'], filename)
+        writer = REPORT_WRITERS[job.file_format](path + '.tmp', report['columns'])
+        try:
+            last_id = None; saved_at = time.monotonic()
+            while True:
+                page = query.filter(id_column > last_id) if last_id is not None else query
+                rows = page.order_by(id_column).limit(app.config['EXPORT_BATCH_SIZE']).all()
+                if not rows: break
+                writer.write(rows); last_id = rows[-1].id
+                job.progress += len(rows)
+                if time.monotonic() - saved_at >= 1: db.session.commit(); saved_at = time.monotonic() # progresso no máximo 1x por segundo
+        finally: writer.close() # o arquivo é fechado mesmo se a leitura falhar no meio
+        os.replace(path + '.tmp', path)
+        now = datetime.utcnow()
+        job.status = 'Concluído'; job.filename = filename; job.finished_at = now; job.expires_at = now + timedelta(seconds=app.config['EXPORT_FILE_TTL'])
+    except Exception as e:
+        export_logger.exception(f"Falha ao gerar o relatório {job_id}")
+        db.session.rollback()
+        if path and os.path.exists(path + '.tmp'): os.remove(path + '.tmp')
+        job.status = 'Falhou'; job.error = str(e)[:255]
+    db.session.commit()
+    socketio.emit('export_finished', export_job_payload(job), room=f"user_{job.company_id}")
+
+@celery.task
+def purge_expired_exports():
+    """
+    Apaga os arquivos de relatórios vencidos e marca como 'Falhou' os pedidos parados em 'Na fila'/'Gerando' há mais de
+    EXPORT_STALE_AFTER (worker que caiu no meio) (agendada no beat do Celery, ver CELERYBEAT_SCHEDULE).
+    """
+    expired = ExportJob.query.filter(ExportJob.status == 'Concluído', ExportJob.expires_at <= datetime.utcnow()).all()
+    for job in expired:
+        try: os.remove(os.path.join(app.config['EXPORT_FOLDER'], job.filename))
+        except FileNotFoundError: pass
+        job.status = 'Expirado'; job.filename = None
+    ExportJob.query.filter(ExportJob.status.in_(('Na fila', 'Gerando')), ExportJob.created_at <= export_stale_cutoff()) \
+        .update({'status': 'Falhou', 'error': 'Tempo limite de geração excedido.'}, synchronize_session=False)
+    db.session.commit()
+    return len(expired)
+
+# --- Importação de Catálogo (Celery) ---
+import_logger = get_task_logger('connecta.imports')
+
+@app.template_global()
+def catalog_import_enabled():
+    """
+    A importação roda no worker, que só consegue invalidar o autocompletar e os caches dos processos web
+    pelo Redis (sem REDIS_URL cada processo tem os seus, em memória). Sem ele a importação fica desligada.
+    """
+    return bool(app.config.get('REDIS_URL'))
+
+# Cabeçalhos aceitos na planilha (minúsculos e sem acento) -> campo do produto
+IMPORT_HEADERS = {'sku': 'sku', 'codigo': 'sku', 'nome': 'name', 'name': 'name', 'descricao': 'description', 'description': 'description',
+                  'categoria': 'category', 'category': 'category', 'preco': 'base_price', 'preco base': 'base_price', 'base_price': 'base_price', 'price': 'base_price',
+                  'imagens': 'images', 'images': 'images'}
+
+def read_catalog_rows(path):
+    """(número da linha na planilha, {campo: valor}) de cada linha de um CSV (',' ou ';') ou XLSX. Colunas desconhecidas são ignoradas."""
+    if path.endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try: rows = workbook.active.iter_rows(values_only=True); yield from _catalog_rows(rows)
+        finally: workbook.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            try: dialect = csv.Sniffer().sniff(f.readline(), delimiters=',;')
+            except csv.Error: dialect = csv.excel # uma coluna só ou arquivo vazio: o Sniffer não acha o separador
+            f.seek(0)
+            yield from _catalog_rows(csv.reader(f, dialect))
+
+def _catalog_rows(rows):
+    fields = [IMPORT_HEADERS.get(normalize_text(str(header or '')).strip()) for header in next(rows, ())]
+    for number, values in enumerate(rows, 2):
+        if any(value not in (None, '') for value in values): yield number, {field: value for field, value in zip(fields, values) if field}
+
+def parse_price(value):
+    """Preço da planilha: número, '1234.56', '1234,56' ou '1.234,56'. ValueError se inválido."""
+    if isinstance(value, (int, float)): price = float(value)
+    else:
+        value = str(value).strip().replace('R$', '').strip()
+        if ',' in value: value = value.replace('.', '').replace(',', '.')
+        price = float(value)
+    if price < 0: raise ValueError(value)
+    return price
+
+def validate_catalog_row(values, image_members):
+    """Dados do produto de uma linha da planilha e a lista de erros encontrados (vazia se a linha é válida)."""
+    product = {key: str(values[key]).strip() if values.get(key) is not None else '' for key in ('sku', 'name', 'description', 'category', 'images')}
+    errors = []
+    for key, label, limit in (('sku', 'SKU', 64), ('name', 'Nome', 100), ('description', 'Descrição', None), ('category', 'Categoria', 80)):
+        if key not in values: errors.append(f"Coluna {label} não encontrada na planilha.")
+        elif not product[key]: errors.append(f"{label} é obrigatório.")
+        elif limit and len(product[key]) > limit: errors.append(f"{label} tem mais de {limit} caracteres.")
+    product['base_price'] = None
+    if values.get('base_price') not in (None, ''):
+        try: product['base_price'] = parse_price(values['base_price'])
+        except ValueError: errors.append(f"Preço inválido: {values['base_price']}.")
+    product['images'] = [name.strip() for name in product['images'].replace(',', ';').split(';') if name.strip()]
+    for name in product['images']:
+        if not allowed_file(name, ALLOWED_IMG_EXTENSIONS): errors.append(f"Imagem {name}: formato não permitido.")
+        elif name not in image_members: errors.append(f"Imagem {name} não encontrada no zip.")
+        elif image_members[name].file_size > app.config['IMPORT_MAX_IMAGE_SIZE']: errors.append(f"Imagem {name} é grande demais.")
+    return product, errors
+
+def import_catalog_batch(supplier_id, products, archive, image_members):
+    """
+    Insere ou atualiza (pelo SKU do fornecedor) um lote de produtos já validados com um INSERT e um UPDATE
+    em lote, e extrai do zip as imagens novas. Retorna (criados, atualizados, ids dos produtos, ids das imagens novas).
+    """
+    fields = ('name', 'description', 'category', 'base_price')
+    existing = dict(db.session.query(Product.sku, Product.id).filter(Product.supplier_id == supplier_id, Product.sku.in_([p['sku'] for p in products])).all())
+    updates = [{'id': existing[p['sku']], **{key: p[key] for key in fields}} for p in products if p['sku'] in existing]
+    inserts = [{'supplier_id': supplier_id, 'sku': p['sku'], **{key: p[key] for key in fields}} for p in products if p['sku'] not in existing]
+    if updates: db.session.execute(update(Product), updates)
+    ids = dict(existing)
+    if inserts: ids.update({row.sku: row.id for row in db.session.execute(insert(Product).returning(Product.sku, Product.id), inserts)})
+    # Imagens: só as que o produto ainda não tem (reimportar a mesma planilha não duplica)
+    current = set(db.session.query(ProductImage.product_id, ProductImage.filename).filter(ProductImage.product_id.in_(ids.values())))
+    image_rows = []
+    for p in products:
+        for name in p['images']:
+            filename = secure_filename(f"{supplier_id}_{name}"); row = (ids[p['sku']], filename)
+            if row in current: continue
+            with archive.open(image_members[name]) as source, open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as target: shutil.copyfileobj(source, target)
+            current.add(row); image_rows.append({'product_id': row[0], 'filename': filename})
+    image_ids = [r.id for r in db.session.execute(insert(ProductImage).returning(ProductImage.id), image_rows)] if image_rows else []
+    return len(inserts), len(updates), list(ids.values()), image_ids
+
+def import_job_payload(job):
+    return {'id': job.id, 'status': job.status, 'processed_rows': job.processed_rows, 'total_rows': job.total_rows, 'percent': job.percent,
+            'created': job.created_count, 'updated': job.updated_count, 'error_count': job.error_count, 'errors': job.error_rows, 'error': job.error}
+
+@celery.task
+def run_catalog_import(job_id):
+    """
+    Importa a planilha de um ImportJob em lotes de IMPORT_BATCH_SIZE linhas (um commit por lote, com o progresso e
+    os erros por linha), enfileira o processamento das imagens e, no fim, atualiza uma única vez o índice de busca,
+    o autocompletar e as facetas do marketplace.
+    """
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.status != 'Na fila': return
+    path = os.path.join(app.config['IMPORT_FOLDER'], job.filename)
+    job.status = 'Processando'; db.session.commit()
+    touched_ids = []; archive = None
+    try:
+        archive = zipfile.ZipFile(os.path.join(app.config['IMPORT_FOLDER'], job.images_filename)) if job.images_filename else None
+        # A planilha pode citar a imagem pelo caminho dentro do zip ou só pelo nome do arquivo
+        image_members = {key: info for info in archive.infolist() if not info.is_dir() for key in (os.path.basename(info.filename), info.filename)} if archive else {}
+        job.total_rows = sum(1 for _ in read_catalog_rows(path)); db.session.commit()
+        rows = read_catalog_rows(path); seen_skus = set(); errors = []
+        while True:
+            chunk = list(islice(rows, app.config['IMPORT_BATCH_SIZE']))
+            if not chunk: break
+            valid = []; image_ids = []
+            for number, values in chunk:
+                product, row_errors = validate_catalog_row(values, image_members)
+                if not row_errors and product['sku'] in seen_skus: row_errors.append('SKU repetido no arquivo.')
+                if row_errors:
+                    job.error_count += 1
+                    if len(errors) < app.config['IMPORT_MAX_ERRORS']: errors.append({'row': number, 'sku': product['sku'], 'errors': row_errors})
+                else: seen_skus.add(product['sku']); valid.append(product)
+            if valid:
+                created, updated, product_ids, image_ids = import_catalog_batch(job.company_id, valid, archive, image_members)
+                job.created_count += created; job.updated_count += updated; touched_ids.extend(product_ids)
+            job.processed_rows += len(chunk); job.errors = json.dumps(errors)
+            db.session.commit()
+            for image_id in image_ids: process_image.delay('product_image', image_id)
+        job.status = 'Concluído'
+    except Exception as e:
+        import_logger.exception(f"Falha na importação de catálogo {job_id}")
+        db.session.rollback()
+        job.status = 'Falhou'; job.error = str(e)[:255]
+    finally:
+        if archive: archive.close()
+    job.finished_at = datetime.utcnow(); db.session.commit()
+    if touched_ids:
+        # Lotes já gravados entram nos índices mesmo se a importação falhou depois
+        sync_products_search(touched_ids); db.session.commit()
+        invalidate_autocomplete_index(); invalidate_marketplace_facets(); fragment_cache.delete('product', *touched_ids)
+        if autocomplete_index.built: load_autocomplete_index()
+    for filename in (job.filename, job.images_filename):
+        if filename and os.path.exists(os.path.join(app.config['IMPORT_FOLDER'], filename)): os.remove(os.path.join(app.config['IMPORT_FOLDER'], filename))
+    socketio.emit('import_finished', import_job_payload(job), room=f"user_{job.company_id}")
+
 # --- Comandos CLI ---
 @app.cli.command("create-admin")
 def create_admin():
@@ -198,6 +1428,70 @@ def create_admin():
     db.session.add(admin_user); db.session.commit()
     print(f"Administrador '{email}' criado com sucesso!")
 
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    """Recria o índice de busca (FTS5) a partir da tabela de produtos."""
+    if db.engine.dialect.name != 'sqlite': print("O índice do PostgreSQL é mantido pelo próprio banco."); return
+    db.session.execute(text("DELETE FROM product_fts"))
+    insert = text("INSERT INTO product_fts (rowid, name, description) VALUES (:id, :name, :description)")
+    rows = db.session.execute(db.select(Product.id, Product.name, Product.description).execution_options(yield_per=5000))
+    total = 0
+    for chunk in rows.partitions():
+        db.session.execute(insert, [{'id': r.id, 'name': search_document(r.name), 'description': search_document(r.description)} for r in chunk])
+        total += len(chunk)
+    db.session.commit()
+    invalidate_autocomplete_index()
+    print(f"Índice de busca recriado com {total} produtos.")
+
+@app.cli.command("build-assets")
+def build_assets():
+    """Gera as cópias com hash (e .gz/.br) dos CSS/JS em static/dist/; rode a cada deploy, antes de iniciar o app."""
+    manifest = build_static_assets()
+    print(f"{len(manifest)} arquivos estáticos gerados em static/{STATIC_BUILD_DIR}/ ({'gzip e brotli' if brotli else 'gzip'}).")
+
+@app.cli.command("move-attachments")
+def move_attachments():
+    """Move os anexos de cotações e do chat de static/ (onde ficavam) para ATTACHMENT_FOLDER e CHAT_ATTACHMENT_FOLDER."""
+    for old, folder in (('attachments', 'ATTACHMENT_FOLDER'), ('chat_attachments', 'CHAT_ATTACHMENT_FOLDER')):
+        source = os.path.join(app.static_folder, old); target = app.config[folder]
+        if not os.path.isdir(source) or os.path.abspath(source) == os.path.abspath(target): continue
+        os.makedirs(target, exist_ok=True); moved = 0
+        for name in os.listdir(source):
+            if not os.path.exists(os.path.join(target, name)): shutil.move(os.path.join(source, name), os.path.join(target, name)); moved += 1
+        print(f"{moved} arquivos movidos de static/{old}/ para {target}.")
+
+@app.cli.command("rebuild-image-variants")
+def rebuild_image_variants():
+    """Enfileira a geração das variantes das imagens de produto e logos que ainda não as têm."""
+    image_ids = [row.id for row in db.session.query(ProductImage.id).filter(ProductImage.variants.is_(None))]
+    logo_ids = [row.id for row in db.session.query(Company.id).filter(Company.logo_filename.isnot(None), Company.logo_variants.is_(None))]
+    for image_id in image_ids: process_image.delay('product_image', image_id)
+    for company_id in logo_ids: process_image.delay('logo', company_id)
+    print(f"Variantes enfileiradas para {len(image_ids)} imagens de produto e {len(logo_ids)} logos.")
+
+@app.cli.command("rebuild-supplier-ratings")
+def rebuild_supplier_ratings():
+    """Recalcula do zero o agregado de avaliações de todos os fornecedores."""
+    SupplierRating.query.delete()
+    aggregates = db.select(
+        Review.supplier_id, func.count(Review.id), func.sum(Review.rating),
+        *[func.sum(case((Review.rating == n, 1), else_=0)) for n in range(1, 6)],
+        func.avg(db.cast(Review.rating, db.Float))
+    ).group_by(Review.supplier_id)
+    columns = ['supplier_id', 'rating_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5', 'rating_avg']
+    db.session.execute(db.insert(SupplierRating).from_select(columns, aggregates))
+    db.session.commit()
+    print(f"Agregado de avaliações recalculado para {SupplierRating.query.count()} fornecedores.")
+
+@app.cli.command("rebuild-company-stats")
+def rebuild_company_stats():
+    """Recalcula do zero as estatísticas do painel de todas as empresas."""
+    CompanyStats.query.delete()
+    company_ids = [row.id for row in db.session.query(Company.id).filter(Company.user_type.in_(['buyer', 'supplier']))]
+    for company_id in company_ids: build_company_stats(company_id)
+    db.session.commit()
+    print(f"Estatísticas recalculadas para {len(company_ids)} empresas.")
+
 # --- Rotas Principais ---
 @app.route('/')
 def home():
@@ -250,21 +1544,8 @@ def forgot_password():
         company = Company.query.filter_by(email=email).first()
         
         if company:
-            # Gerar token (válido por 1800 segundos = 30 minutos)
-            token = s.dumps(email, salt='password-reset-salt')
-            reset_url = url_for('reset_password', token=token, _external=True)
-            
-            html_body = render_template(
-                'email/reset_password.html',
-                company_name=company.company_name,
-                reset_url=reset_url
-            )
-            
-            send_email(
-                subject="Recuperação de Senha - Connecta B2B",
-                recipients=[company.email],
-                html_body=html_body
-            )
+            # O worker gera o token (válido por 30 minutos) e monta o e-mail
+            send_email('reset_password', company_id=company.id)
             
             flash('Um link de recuperação foi enviado para o seu e-mail.', 'success')
             return redirect(url_for('login'))
@@ -318,18 +1599,26 @@ def dashboard():
     if session.get('is_admin'): return redirect(url_for('admin.index'))
     company = db.session.get(Company, session['company_id'])
     view = request.args.get('view', 'active')
-    active_announcement = Announcement.query.filter_by(is_active=True).order_by(Announcement.timestamp.desc()).first()
+    announcement_bar = cached_fragment('announcement', 'active', lambda: render_template('_announcement_bar.html',
+        announcement=Announcement.query.filter_by(is_active=True).order_by(Announcement.timestamp.desc()).first()))
     analytics = {}
+    page_size = app.config['DASHBOARD_PAGE_SIZE']; cursor = request.args.get('before')
+    stats = get_company_stats(company.id) # Antes das demais consultas: na primeira visita ele grava (commit) as estatísticas
     if company.user_type == 'supplier':
-        quotes_query = company.received_quotes
-        active_quotes = quotes_query.filter(or_(QuoteRequest.status == 'Pendente', QuoteRequest.status == 'Respondido')).order_by(QuoteRequest.timestamp.desc()).all()
-        archived_quotes = quotes_query.filter(or_(QuoteRequest.status == 'Aceito', QuoteRequest.status == 'Recusado')).order_by(QuoteRequest.timestamp.desc()).all()
-        analytics['total_quotes'] = quotes_query.count(); analytics['accepted_quotes'] = quotes_query.filter_by(status='Aceito').count(); analytics['acceptance_rate'] = (analytics['accepted_quotes'] / analytics['total_quotes'] * 100) if analytics['total_quotes'] > 0 else 0; analytics['avg_rating'] = db.session.query(func.avg(Review.rating)).filter(Review.supplier_id == company.id).scalar() or 0
-        return render_template('dashboard.html', products=company.products, active_quotes=active_quotes, archived_quotes=archived_quotes, view=view, analytics=analytics, active_announcement=active_announcement)
+        # Caixa de entrada paginada por cursor, com produto e comprador na mesma consulta
+        statuses = ['Aceito', 'Recusado'] if view == 'archived' else ['Pendente', 'Respondido']
+        inbox = db.session.query(QuoteRequest.id, QuoteRequest.status, QuoteRequest.timestamp, Product.name.label('product_name'), Company.company_name.label('buyer_name'), Company.is_verified.label('buyer_verified')) \
+            .join(Product, QuoteRequest.product_id == Product.id).join(Company, QuoteRequest.buyer_id == Company.id) \
+            .filter(QuoteRequest.supplier_id == company.id, QuoteRequest.status.in_(statuses))
+        quotes, next_cursor = keyset_page(inbox, QuoteRequest.timestamp, QuoteRequest.id, cursor, page_size)
+        analytics['total_quotes'] = stats.total_quotes; analytics['accepted_quotes'] = stats.quotes_accepted; analytics['acceptance_rate'] = stats.acceptance_rate; analytics['avg_rating'] = supplier_avg_ratings([company.id])[company.id]
+        analytics['gmv'] = stats.gmv; analytics['median_response_hours'] = stats.median_response_seconds / 3600 if stats.median_response_seconds is not None else None
+        return render_template('dashboard.html', products=company.products, quotes=quotes, next_cursor=next_cursor, view=view, analytics=analytics, announcement_bar=announcement_bar)
     elif company.user_type == 'buyer':
-        quote_groups = QuoteGroup.query.filter_by(buyer_id=company.id).order_by(QuoteGroup.timestamp.desc()).all()
-        analytics['total_sent'] = company.sent_quotes.count(); analytics['total_accepted'] = company.sent_quotes.filter_by(status='Aceito').count()
-        return render_template('dashboard.html', quote_groups=quote_groups, view=view, analytics=analytics, active_announcement=active_announcement)
+        quote_groups, next_cursor = keyset_page(QuoteGroup.query.filter_by(buyer_id=company.id), QuoteGroup.timestamp, QuoteGroup.id, cursor, page_size)
+        group_sizes = dict(db.session.query(QuoteRequest.group_id, func.count(QuoteRequest.id)).filter(QuoteRequest.group_id.in_([g.id for g in quote_groups])).group_by(QuoteRequest.group_id).all()) if quote_groups else {}
+        analytics['total_sent'] = stats.total_quotes; analytics['total_accepted'] = stats.quotes_accepted; analytics['gmv'] = stats.gmv
+        return render_template('dashboard.html', quote_groups=quote_groups, group_sizes=group_sizes, next_cursor=next_cursor, view=view, analytics=analytics, announcement_bar=announcement_bar)
     return redirect(url_for('home'))
 
 @app.route('/chat/<int:quote_id>')
@@ -337,8 +1626,30 @@ def dashboard():
 def chat(quote_id):
     quote = db.session.get(QuoteRequest, quote_id)
     if session['company_id'] not in [quote.buyer_id, quote.supplier_id]: flash('Acesso não permitido.', 'error'); return redirect(url_for('dashboard'))
-    messages = ChatMessage.query.filter_by(quote_id=quote.id).order_by(ChatMessage.timestamp.asc()).all()
-    return render_template('chat.html', quote=quote, messages=messages)
+    messages, history_cursor = chat_history_page(quote.id)
+    return render_template('chat.html', quote=quote, messages=messages, history_cursor=history_cursor)
+def chat_history_page(quote_id, cursor=None):
+    """Mensagens do chat anteriores ao cursor (as mais recentes, em ordem cronológica) com o nome do remetente na mesma consulta."""
+    chat_writer.flush()  # inclui as mensagens ainda na fila de gravação
+    query = (db.session.query(ChatMessage.id, ChatMessage.message, ChatMessage.timestamp, ChatMessage.sender_id, ChatMessage.attachment_filename, ChatMessage.attachment_type,
+                              Company.company_name.label('sender_name'))
+             .join(Company, ChatMessage.sender_id == Company.id).filter(ChatMessage.quote_id == quote_id))
+    messages, next_cursor = keyset_page(query, ChatMessage.timestamp, ChatMessage.id, cursor, app.config['CHAT_HISTORY_PAGE_SIZE'])
+    messages.reverse()
+    return messages, next_cursor
+def chat_message_payload(message):
+    return {'message': message.message, 'sender_name': message.sender_name, 'timestamp': message.timestamp.strftime('%d/%m/%Y %H:%M'),
+            'attachment_filename': message.attachment_filename, 'attachment_type': message.attachment_type}
+def is_chat_participant(quote_id, company_id):
+    participants = db.session.query(QuoteRequest.buyer_id, QuoteRequest.supplier_id).filter_by(id=quote_id).first()
+    return participants is not None and company_id in participants
+@app.route('/chat/<int:quote_id>/history')
+@login_required
+def chat_history(quote_id):
+    """Páginas anteriores do chat (?before=cursor), do mesmo jeito que o evento 'load_history' do Socket.IO."""
+    if not is_chat_participant(quote_id, session['company_id']): return jsonify({'error': 'Acesso não permitido.'}), 403
+    messages, next_cursor = chat_history_page(quote_id, request.args.get('before'))
+    return jsonify({'messages': [chat_message_payload(m) for m in messages], 'next_cursor': next_cursor})
 
 # --- NOVAS ROTAS PARA RFQ ABERTO ---
 @app.route('/rfq/open/new', methods=['GET', 'POST'])
@@ -404,22 +1715,9 @@ def open_rfq_detail(rfq_id):
             rfq_id=rfq.id, supplier_id=session['company_id']
         )
         db.session.add(new_response)
-        db.session.commit() # Commit da resposta
 
-        # Notificar o comprador
-        notification = Notification(
-            message=f"Sua RFQ '{rfq.title}' recebeu uma nova proposta.",
-            link=url_for('open_rfq_detail', rfq_id=rfq.id),
-            recipient_id=rfq.buyer_id
-        )
-        db.session.add(notification)
-        db.session.commit() # Commit da notificação
-
-        # Emitir notificação em tempo real
-        unread_count = db.session.query(Notification).filter_by(recipient_id=rfq.buyer_id, read=False).count()
-        socketio.emit('new_notification', 
-                      {'unread_count': unread_count}, 
-                      room=f"user_{rfq.buyer_id}")
+        # Notificar o comprador (grava a resposta e a notificação juntas)
+        dispatch_notifications([(rfq.buyer_id, f"Sua RFQ '{rfq.title}' recebeu uma nova proposta.", url_for('open_rfq_detail', rfq_id=rfq.id))])
         
         flash('Sua proposta foi enviada!', 'success')
         return redirect(url_for('open_rfq_detail', rfq_id=rfq.id))
@@ -427,41 +1725,143 @@ def open_rfq_detail(rfq_id):
     return render_template('open_rfq_detail.html', rfq=rfq)
 # --- FIM DAS NOVAS ROTAS ---
 
-@app.route('/products')
-@login_required
-def products():
-    page = request.args.get('page', 1, type=int)
-    search_query = request.args.get('search', ''); category_query = request.args.get('category', '')
-    price_min = request.args.get('price_min', type=float); price_max = request.args.get('price_max', type=float)
-    location_query = request.args.get('location', ''); rating_min = request.args.get('rating_min', type=float)
+PRODUCTS_PER_PAGE = 9
+PRODUCTS_COUNT_CAP = 1000 # Acima disso o marketplace mostra apenas "mais de 1000"
+
+def marketplace_query(args):
+    """
+    Aplica os filtros do marketplace (busca, categoria, preço, localização e avaliação).
+    Retorna (query, ordenação, valores dos filtros para o template).
+    """
+    search_query = args.get('search', ''); category_query = args.get('category', '')
+    price_min = args.get('price_min', type=float); price_max = args.get('price_max', type=float)
+    price_below = args.get('price_below', type=float) # limite exclusivo, usado pelos links das faixas de preço [mínimo, máximo)
+    location_query = args.get('location', ''); rating_min = args.get('rating_min', type=float)
     query = Product.query.join(Company, Product.supplier_id == Company.id)
-    if search_query: query = query.filter(or_(Product.name.ilike(f"%{search_query}%"), Product.description.ilike(f"%{search_query}%")))
+    relevance = None
+    if search_query: query, relevance = apply_product_search(query, search_query)
     if category_query: query = query.filter(Product.category == category_query)
     if price_min is not None: query = query.filter(Product.base_price >= price_min)
     if price_max is not None: query = query.filter(Product.base_price <= price_max)
+    if price_below is not None: query = query.filter(Product.base_price < price_below)
     if location_query: query = query.filter(Company.address.ilike(f"%{location_query}%"))
     if rating_min is not None and rating_min > 0:
-        avg_ratings = db.session.query(Review.supplier_id, func.avg(Review.rating).label('avg_rating')).group_by(Review.supplier_id).subquery()
-        query = query.join(avg_ratings, Product.supplier_id == avg_ratings.c.supplier_id).filter(avg_ratings.c.avg_rating >= rating_min)
-    pagination = query.order_by(Product.id.desc()).paginate(page=page, per_page=9)
-    categories = db.session.query(Product.category).distinct().all()
-    filter_values = {'search': search_query, 'category': category_query, 'price_min': price_min, 'price_max': price_max, 'location': location_query, 'rating_min': rating_min }
-    return render_template('products.html', pagination=pagination, categories=[c[0] for c in categories], filters=filter_values)
+        query = query.join(SupplierRating, Product.supplier_id == SupplierRating.supplier_id).filter(SupplierRating.rating_avg >= rating_min)
+    ordering = [relevance, Product.id.desc()] if relevance is not None else [Product.id.desc()]
+    filter_values = {'search': search_query, 'category': category_query, 'price_min': price_min, 'price_max': price_max, 'price_below': price_below, 'location': location_query, 'rating_min': rating_min }
+    return query, ordering, filter_values
+
+@app.route('/products')
+@login_required
+def products():
+    etag, not_modified = conditional_etag(page_viewer_state(), catalog_version())
+    if not_modified: return not_modified
+    query, ordering, filter_values = marketplace_query(request.args)
+    query = query.options(contains_eager(Product.supplier), selectinload(Product.images))
+    pagination = None; next_after = None
+    if 'page' in request.args or filter_values['search']:
+        # Paginação por número de página (links antigos e resultados ordenados por relevância)
+        pagination = query.order_by(*ordering).paginate(page=request.args.get('page', 1, type=int), per_page=PRODUCTS_PER_PAGE)
+        product_list = pagination.items
+    else:
+        # Paginação por cursor: busca os produtos com id menor que ?after=, sem COUNT nem OFFSET
+        after = request.args.get('after', type=int)
+        if after: query = query.filter(Product.id < after)
+        product_list = query.order_by(*ordering).limit(PRODUCTS_PER_PAGE + 1).all()
+        if len(product_list) > PRODUCTS_PER_PAGE:
+            product_list = product_list[:PRODUCTS_PER_PAGE]; next_after = product_list[-1].id
+    facets = marketplace_facets(request.args)
+    categories = sorted(set(facets['categories']) | ({filter_values['category']} if filter_values['category'] else set()))
+    price_buckets = [{'label': _price_bucket_label(low, high), 'price_min': low, 'price_below': high, 'count': count} for (low, high), count in zip(PRICE_BUCKETS, facets['prices'])]
+    return with_etag(render_template('products.html', products=product_list, pagination=pagination, next_after=next_after, categories=categories, facets=facets, price_buckets=price_buckets, filters=filter_values), etag)
+
+@app.route('/products/count')
+@login_required
+def products_count():
+    """Total de produtos para os filtros atuais, limitado a PRODUCTS_COUNT_CAP (carregado pelo JS da página)."""
+    query, _, _ = marketplace_query(request.args)
+    capped = query.with_entities(Product.id).limit(PRODUCTS_COUNT_CAP + 1).subquery()
+    count = db.session.query(func.count()).select_from(capped).scalar()
+    return jsonify({'count': min(count, PRODUCTS_COUNT_CAP), 'more': count > PRODUCTS_COUNT_CAP})
+
+# --- Facetas do Marketplace ---
+# Faixas de preço [mínimo, máximo) exibidas nos filtros; produtos sem preço contam como "Sob consulta"
+PRICE_BUCKETS = [(None, 100), (100, 500), (500, 1000), (1000, 5000), (5000, None)]
+RATING_FLOORS = [4, 3, 2, 1]
+facet_cache = SharedCache('facets')
+
+def _price_bucket_label(low, high):
+    if low is None: return f"Até R$ {high}"
+    if high is None: return f"Acima de R$ {low}"
+    return f"R$ {low} a {high}"
+
+def _price_condition(low, high):
+    conditions = [Product.base_price >= low] if low is not None else [Product.base_price.isnot(None)]
+    if high is not None: conditions.append(Product.base_price < high)
+    return and_(*conditions)
+
+def compute_marketplace_facets(args):
+    """
+    Contagens por categoria, faixa de preço e avaliação mínima em uma única consulta agrupada.
+    Cada faceta ignora o próprio filtro (a contagem de uma categoria não depende da categoria escolhida).
+    """
+    facet_args = args.copy()
+    for name in ('category', 'rating_min', 'price_min', 'price_max', 'price_below'): facet_args.pop(name, None)
+    query, _, _ = marketplace_query(facet_args)
+    price_bucket = case(*[(_price_condition(low, high), i) for i, (low, high) in enumerate(PRICE_BUCKETS)], else_=len(PRICE_BUCKETS))
+    rating_floor = case(*[(SupplierRating.rating_avg >= floor, floor) for floor in RATING_FLOORS], else_=0)
+    # A faixa de preço escolhida vira uma coluna do agrupamento: vale para categorias e avaliações, mas não para as faixas de preço
+    price_min = args.get('price_min', type=float); price_max = args.get('price_max', type=float); price_below = args.get('price_below', type=float)
+    price_conditions = (([Product.base_price >= price_min] if price_min is not None else []) + ([Product.base_price <= price_max] if price_max is not None else [])
+                        + ([Product.base_price < price_below] if price_below is not None else []))
+    in_price = case((and_(true(), *price_conditions), 1), else_=0)
+    rows = (query.outerjoin(SupplierRating, Product.supplier_id == SupplierRating.supplier_id)
+                 .with_entities(Product.category, price_bucket, rating_floor, in_price, func.count(Product.id))
+                 .group_by(Product.category, price_bucket, rating_floor, in_price).order_by(None).all())
+    category = args.get('category', ''); rating_min = args.get('rating_min', type=float) or 0
+    facets = {'categories': {}, 'prices': [0] * (len(PRICE_BUCKETS) + 1), 'ratings': {str(floor): 0 for floor in RATING_FLOORS}}
+    for row_category, bucket, floor, row_in_price, count in rows:
+        if row_in_price and floor >= rating_min: facets['categories'][row_category] = facets['categories'].get(row_category, 0) + count
+        if not category or row_category == category:
+            if row_in_price:
+                for rating in RATING_FLOORS:
+                    if floor >= rating: facets['ratings'][str(rating)] += count
+            if floor >= rating_min: facets['prices'][bucket] += count
+    return facets
+
+def marketplace_facets(args):
+    """Facetas para os filtros atuais; sem filtros, vêm do cache (invalidado quando produtos ou avaliações mudam)."""
+    if any(args.get(name) for name in ('search', 'category', 'price_min', 'price_max', 'price_below', 'location', 'rating_min')):
+        return compute_marketplace_facets(args)
+    facets = facet_cache.get('unfiltered')
+    if facets is None:
+        facets = compute_marketplace_facets(args)
+        facet_cache.set('unfiltered', facets, app.config['FACETS_CACHE_TTL'])
+    return facets
+
+def invalidate_marketplace_facets():
+    facet_cache.delete('unfiltered')
 
 @app.route('/autocomplete_search')
 @login_required
 def autocomplete_search():
     query = request.args.get('query', '')
     if len(query) < 2: return jsonify([])
-    search_term = f"%{query}%"
-    results = Product.query.filter(Product.name.ilike(search_term)).limit(5).all()
-    return jsonify([product.name for product in results])
+    ensure_autocomplete_index()
+    # Versão do Redis em que o índice local foi montado: igual em todos os processos (sem Redis, a do próprio índice)
+    etag, not_modified = conditional_etag(_autocomplete_sync['version'] if _autocomplete_sync['version'] is not None else autocomplete_index.version)
+    if not_modified: return not_modified
+    return with_etag(jsonify(autocomplete_index.search(query, limit=5)), etag)
 
 @app.route('/product/<int:product_id>', methods=['GET','POST'])
 @login_required
 def product_detail(product_id):
     product = db.session.get(Product, product_id)
-    return render_template('product_detail.html', product=product)
+    if product is None: abort(404)
+    etag, not_modified = conditional_etag(page_viewer_state(), product.updated_at, product.supplier.updated_at)
+    if not_modified: return not_modified
+    product_card = cached_fragment('product', product_id, lambda: render_template('_product_card.html', product=product))
+    return with_etag(render_template('product_detail.html', product=product, product_card=product_card), etag)
 
 @app.route('/cart/add/<int:product_id>', methods=['POST'])
 @login_required
@@ -518,32 +1918,39 @@ def submit_cart_quotes():
     if not cart_data: flash('Seu carrinho está vazio.', 'error'); return redirect(url_for('view_cart'))
     if not group_name: flash('O nome do grupo de cotação é obrigatório.', 'error'); return redirect(url_for('view_cart'))
     
-    new_group = QuoteGroup(name=group_name, buyer_id=session['company_id'])
-    db.session.add(new_group); db.session.flush()
-
-    supplier_notifications = {} # Rastrear fornecedores para notificar
 
-    for product_id, item_data in cart_data.items():
-        product = db.session.get(Product, int(product_id))
-        if product:
-            new_quote = QuoteRequest(quantity=item_data['quantity'], product_id=product.id, buyer_id=session['company_id'], supplier_id=product.supplier_id, group_id=new_group.id)
-            db.session.add(new_quote)
-            db.session.flush()
-            notification = Notification(message=f"Nova cotação para {product.name} (Grupo: {group_name}).", link=url_for('quote_detail', quote_id=new_quote.id), recipient_id=product.supplier_id)
-            db.session.add(notification)
-            supplier_notifications[product.supplier_id] = True # Marcar fornecedor para notificação
+    # Todos os produtos do carrinho em uma consulta; os excluídos desde então ficam de fora
+    products = {p.id: p for p in db.session.query(Product.id, Product.name, Product.supplier_id).filter(Product.id.in_([int(pid) for pid in cart_data]))}
+    missing = len(cart_data) - len(products)
+    if not products:
+        session.pop('cart', None)
+        flash('Os produtos do seu carrinho não estão mais disponíveis.', 'error'); return redirect(url_for('view_cart'))
 
-    db.session.commit() # Commit de cotações e notificações
+    new_group = QuoteGroup(name=group_name, buyer_id=session['company_id'])
+    db.session.add(new_group); db.session.flush()
 
-    # Emitir notificações em tempo real para fornecedores
-    for supplier_id in supplier_notifications.keys():
-        unread_count = db.session.query(Notification).filter_by(recipient_id=supplier_id, read=False).count()
-        socketio.emit('new_notification', 
-                      {'unread_count': unread_count}, 
-                      room=f"user_{supplier_id}")
+    # Cotações inseridas em lote; o RETURNING traz (id, produto) de cada uma para os links das notificações
+    rows = [{'quantity': int(item_data['quantity']), 'product_id': int(pid), 'buyer_id': session['company_id'], 'supplier_id': products[int(pid)].supplier_id,
+             'group_id': new_group.id, 'status': 'Pendente'} for pid, item_data in cart_data.items() if int(pid) in products]
+    created = db.session.execute(insert(QuoteRequest).returning(QuoteRequest.id, QuoteRequest.product_id), rows).all()
+
+    supplier_notifications = Counter() # Novas cotações por fornecedor
+    notifications = [] # (fornecedor, mensagem, link)
+    for quote_id, product_id in created:
+        product = products[product_id]
+        notifications.append((product.supplier_id, f"Nova cotação para {product.name} (Grupo: {group_name}).", url_for('quote_detail', quote_id=quote_id)))
+        supplier_notifications[product.supplier_id] += 1
+
+    # Estatísticas do painel: novas cotações pendentes para o comprador e para cada fornecedor
+    update_company_stats(session['company_id'], {'Pendente': len(created)})
+    for supplier_id, count in supplier_notifications.items(): update_company_stats(supplier_id, {'Pendente': count})
+    dispatch_notifications(notifications) # Um único commit para grupo, cotações e notificações + aviso em tempo real aos fornecedores
+    if autocomplete_index.built:
+        for _, product_id in created: autocomplete_index.bump(product_id)
 
     session.pop('cart', None)
     flash('Cotações enviadas com sucesso!', 'success')
+    if missing: flash(f'{missing} produto(s) do carrinho foram removidos da plataforma e não entraram no grupo.', 'info')
     return redirect(url_for('dashboard'))
 
 @app.route('/comparator/<int:group_id>')
@@ -553,41 +1960,70 @@ def comparator(group_id):
     if not group or group.buyer_id != session['company_id']:
         flash('Grupo de cotação não encontrado ou não autorizado.', 'error'); return redirect(url_for('dashboard'))
     quotes = QuoteRequest.query.filter_by(group_id=group.id).options(joinedload(QuoteRequest.product), joinedload(QuoteRequest.supplier)).all()
-    supplier_ratings = {}
-    for quote in quotes:
-        if quote.supplier_id not in supplier_ratings:
-            avg_rating = db.session.query(func.avg(Review.rating)).filter(Review.supplier_id == quote.supplier_id).scalar() or 0
-            supplier_ratings[quote.supplier_id] = avg_rating
+    supplier_ratings = supplier_avg_ratings({quote.supplier_id for quote in quotes})
     return render_template('comparator.html', group=group, quotes=quotes, supplier_ratings=supplier_ratings)
 
 @app.route('/uploads/attachments/<filename>')
 @login_required
-def download_attachment(filename): return send_from_directory(app.config['ATTACHMENT_FOLDER'], filename, as_attachment=True)
+def download_attachment(filename):
+    company_id = session['company_id']
+    allowed = session.get('is_admin') or db.session.query(QuoteRequest.id).filter(
+        QuoteRequest.attachment_filename == filename, or_(QuoteRequest.buyer_id == company_id, QuoteRequest.supplier_id == company_id)).first()
+    if not allowed: flash('Acesso negado a este anexo.', 'error'); return redirect(url_for('dashboard'))
+    return send_protected_file(app.config['ATTACHMENT_FOLDER'], filename)
+
+def chat_attachment_quote_id(filename):
+    """Cotação de um anexo do chat, pelo prefixo 'q<id>_' que upload_chat_file põe no nome (None nos anexos antigos, sem prefixo)."""
+    prefix = filename.split('_', 1)[0]
+    return int(prefix[1:]) if prefix.startswith('q') and prefix[1:].isdigit() else None
 
 @app.route('/uploads/chat/<filename>') # Rota para baixar anexos do chat
 @login_required
 def download_chat_attachment(filename):
-    return send_from_directory(app.config['CHAT_ATTACHMENT_FOLDER'], filename, as_attachment=True)
+    company_id = session['company_id']
+    # A cotação vem do nome do arquivo: não depende de a mensagem já ter sido gravada pelo ChatWriter
+    quote_id = chat_attachment_quote_id(filename)
+    if quote_id is not None: allowed = is_chat_participant(quote_id, company_id)
+    else:
+        allowed = (db.session.query(ChatMessage.id).join(QuoteRequest, ChatMessage.quote_id == QuoteRequest.id)
+                   .filter(ChatMessage.attachment_filename == filename, or_(QuoteRequest.buyer_id == company_id, QuoteRequest.supplier_id == company_id)).first())
+    if not allowed: flash('Acesso negado a este anexo.', 'error'); return redirect(url_for('dashboard'))
+    return send_protected_file(app.config['CHAT_ATTACHMENT_FOLDER'], filename)
 
 @app.route('/company/<int:company_id>')
 @login_required
 def company_profile(company_id):
     company = db.session.get(Company, company_id)
-    avg_rating = db.session.query(func.avg(Review.rating)).filter(Review.supplier_id == company.id).scalar()
-    reviews = Review.query.filter_by(supplier_id=company_id).order_by(Review.timestamp.desc()).all()
-    return render_template('company_profile.html', company=company, avg_rating=avg_rating, reviews=reviews)
+    if company is None: abort(404)
+    etag, not_modified = conditional_etag(page_viewer_state(), company.updated_at, db.session.query(func.max(Review.updated_at)).filter(Review.supplier_id == company.id).scalar())
+    if not_modified: return not_modified
+    def render_header():
+        rating_summary = db.session.get(SupplierRating, company.id)
+        return render_template('_supplier_header.html', company=company, avg_rating=rating_summary.rating_avg if rating_summary else None)
+    def render_reviews():
+        reviews = db.session.query(Review.rating, Review.comment, Review.timestamp, Review.reviewer_id, Company.company_name.label('reviewer_name')) \
+            .join(Company, Review.reviewer_id == Company.id).filter(Review.supplier_id == company.id).order_by(Review.timestamp.desc()).all()
+        return render_template('_reviews_block.html', reviews=reviews)
+    supplier_header = cached_fragment('supplier_header', company.id, render_header)
+    reviews_block = cached_fragment('reviews', company.id, render_reviews) if company.user_type == 'supplier' else None
+    return with_etag(render_template('company_profile.html', company=company, supplier_header=supplier_header, reviews_block=reviews_block), etag)
 
 @app.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     company = db.session.get(Company, session['company_id'])
     if request.method == 'POST':
+        if company.company_name != request.form.get('company_name'): # o nome aparece nas avaliações que a empresa fez
+            Review.query.filter_by(reviewer_id=company.id).update({Review.updated_at: datetime.utcnow()}, synchronize_session=False)
         company.company_name = request.form.get('company_name'); session['company_name'] = company.company_name
         company.description = request.form.get('description'); company.website = request.form.get('website'); company.address = request.form.get('address'); company.certifications = request.form.get('certifications')
-        logo_file = request.files.get('logo')
-        if logo_file and allowed_file(logo_file.filename, ALLOWED_IMG_EXTENSIONS):
+        logo_file = request.files.get('logo'); new_logo = bool(logo_file and allowed_file(logo_file.filename, ALLOWED_IMG_EXTENSIONS))
+        if new_logo:
             filename = secure_filename(f"logo_{company.id}_{logo_file.filename}"); logo_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename)); company.logo_filename = filename
-        db.session.commit(); flash('Perfil atualizado com sucesso!', 'success'); return redirect(url_for('company_profile', company_id=company.id))
+            company.logo_variants = None # o original é exibido até o worker gerar as novas variantes
+        db.session.commit(); company_changed(company)
+        if new_logo: process_image.delay('logo', company.id)
+        flash('Perfil atualizado com sucesso!', 'success'); return redirect(url_for('company_profile', company_id=company.id))
     return render_template('edit_profile.html', company=company)
 
 @app.route('/quote/<int:quote_id>/review', methods=['GET', 'POST'])
@@ -599,8 +2035,9 @@ def add_review(quote_id):
     if request.method == 'POST':
         rating = request.form.get('rating'); comment = request.form.get('comment')
         if not rating: flash('A nota é obrigatória.', 'error'); return redirect(url_for('add_review', quote_id=quote.id))
+        if rating not in {'1', '2', '3', '4', '5'}: flash('A nota deve ser de 1 a 5.', 'error'); return redirect(url_for('add_review', quote_id=quote.id))
         new_review = Review(rating=int(rating), comment=comment, quote_id=quote.id, reviewer_id=quote.buyer_id, supplier_id=quote.supplier_id)
-        db.session.add(new_review); db.session.commit(); flash('Avaliação enviada com sucesso!', 'success'); return redirect(url_for('dashboard'))
+        db.session.add(new_review); update_supplier_rating(quote.supplier_id, new_review.rating, 1); db.session.commit(); supplier_reviews_changed(quote.supplier_id); flash('Avaliação enviada com sucesso!', 'success'); return redirect(url_for('dashboard'))
     return render_template('add_review.html', quote=quote)
 
 @app.route('/quote/<int:quote_id>', methods=['GET','POST'])
@@ -612,20 +2049,13 @@ def quote_detail(quote_id):
         if session['user_type'] != 'supplier' or session['company_id'] != quote.supplier_id: flash('Ação não permitida.', 'error'); return redirect(url_for('quote_detail', quote_id=quote.id))
         offered_price_str = request.form.get('offered_price'); delivery_date_str = request.form.get('delivery_date')
         if not offered_price_str: flash('O preço da oferta é obrigatório.', 'error'); return redirect(url_for('quote_detail', quote_id=quote.id))
+        old_status = quote.status
         quote.offered_price=float(offered_price_str); quote.status='Respondido'; quote.response_timestamp=datetime.utcnow()
         if delivery_date_str: quote.delivery_date = datetime.strptime(delivery_date_str, '%Y-%m-%d').date()
-        notification = Notification(message=f"Cotação para {quote.product.name} foi respondida.", link=url_for('quote_detail', quote_id=quote.id), recipient_id=quote.buyer_id)
-        db.session.add(notification); db.session.commit()
-
-        # Emitir notificação em tempo real
-        unread_count = db.session.query(Notification).filter_by(recipient_id=quote.buyer_id, read=False).count()
-        socketio.emit('new_notification', 
-                      {'unread_count': unread_count}, 
-                      room=f"user_{quote.buyer_id}")
-
-        buyer_email = quote.buyer.email; supplier_name = quote.supplier.company_name
-        email_html = f"<p>Olá, {quote.buyer.company_name},</p><p>Sua solicitação para <strong>{quote.product.name}</strong> foi respondida por <strong>{supplier_name}</strong>.</p><p>Acesse a plataforma para visualizar.</p>"
-        send_email("Sua cotação foi respondida!", [buyer_email], email_html)
+        record_quote_status_change(quote, old_status)
+        dispatch_notifications([(quote.buyer_id, f"Cotação para {quote.product.name} foi respondida.", url_for('quote_detail', quote_id=quote.id))])
+
+        send_email('quote_responded', quote_id=quote.id)
         flash('Proposta enviada!', 'success'); return redirect(url_for('dashboard'))
     return render_template('quote_detail.html', quote=quote)
 
@@ -634,19 +2064,11 @@ def quote_detail(quote_id):
 def accept_quote(quote_id):
     quote = db.session.get(QuoteRequest, quote_id)
     if session.get('user_type') != 'buyer' or session.get('company_id') != quote.buyer_id: flash('Ação não permitida.', 'error'); return redirect(url_for('dashboard'))
-    quote.status = 'Aceito'
-    notification = Notification(message=f"A proposta para {quote.product.name} foi ACEITA.", link=url_for('quote_detail', quote_id=quote.id), recipient_id=quote.supplier_id)
-    db.session.add(notification); db.session.commit()
-
-    # Emitir notificação em tempo real
-    unread_count = db.session.query(Notification).filter_by(recipient_id=quote.supplier_id, read=False).count()
-    socketio.emit('new_notification', 
-                  {'unread_count': unread_count}, 
-                  room=f"user_{quote.supplier_id}")
+    old_status = quote.status; quote.status = 'Aceito'
+    record_quote_status_change(quote, old_status)
+    dispatch_notifications([(quote.supplier_id, f"A proposta para {quote.product.name} foi ACEITA.", url_for('quote_detail', quote_id=quote.id))])
     
-    supplier_email = quote.supplier.email; buyer_name = quote.buyer.company_name
-    email_html = f"<p>Parabéns, {quote.supplier.company_name}!</p><p>Sua proposta para <strong>{quote.product.name}</strong> foi aceita por <strong>{buyer_name}</strong>.</p>"
-    send_email("Sua proposta foi aceita!", [supplier_email], email_html)
+    send_email('quote_accepted', quote_id=quote.id)
     flash('Proposta aceita!', 'success'); return redirect(url_for('dashboard'))
 
 @app.route('/quote/<int:quote_id>/decline', methods=['POST'])
@@ -654,19 +2076,11 @@ def accept_quote(quote_id):
 def decline_quote(quote_id):
     quote = db.session.get(QuoteRequest, quote_id)
     if session.get('user_type') != 'buyer' or session.get('company_id') != quote.buyer_id: flash('Ação não permitida.', 'error'); return redirect(url_for('dashboard'))
-    quote.status = 'Recusado'
-    notification = Notification(message=f"A proposta para {quote.product.name} foi recusada.", link=url_for('quote_detail', quote_id=quote.id), recipient_id=quote.supplier_id)
-    db.session.add(notification); db.session.commit()
-
-    # Emitir notificação em tempo real
-    unread_count = db.session.query(Notification).filter_by(recipient_id=quote.supplier_id, read=False).count()
-    socketio.emit('new_notification', 
-                  {'unread_count': unread_count}, 
-                  room=f"user_{quote.supplier_id}")
-
-    supplier_email = quote.supplier.email; buyer_name = quote.buyer.company_name
-    email_html = f"<p>Olá, {quote.supplier.company_name},</p><p>Sua proposta para <strong>{quote.product.name}</strong> foi recusada por <strong>{buyer_name}</strong>.</p>"
-    send_email("Sua proposta foi recusada.", [supplier_email], email_html)
+    old_status = quote.status; quote.status = 'Recusado'
+    record_quote_status_change(quote, old_status)
+    dispatch_notifications([(quote.supplier_id, f"A proposta para {quote.product.name} foi recusada.", url_for('quote_detail', quote_id=quote.id))])
+
+    send_email('quote_declined', quote_id=quote.id)
     flash('Proposta recusada.', 'info'); return redirect(url_for('dashboard'))
 
 @app.route('/add_product', methods=['GET', 'POST'])
@@ -679,13 +2093,16 @@ def add_product():
         base_price = float(base_price_str) if base_price_str else None
         new_product=Product(name=name, description=description, category=category, base_price=base_price, supplier_id=session['company_id'])
         db.session.add(new_product); db.session.flush()
-        images = request.files.getlist('product_images')
+        images = request.files.getlist('product_images'); new_images = []
         for image_file in images:
             if image_file and allowed_file(image_file.filename, ALLOWED_IMG_EXTENSIONS):
                 filename=secure_filename(image_file.filename); image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                 new_image = ProductImage(filename=filename, product_id=new_product.id)
-                db.session.add(new_image)
-        db.session.commit(); flash('Produto adicionado com sucesso!', 'success'); return redirect(url_for('dashboard'))
+                db.session.add(new_image); new_images.append(new_image)
+        sync_product_search(new_product)
+        db.session.commit(); product_saved(new_product)
+        for image in new_images: process_image.delay('product_image', image.id)
+        flash('Produto adicionado com sucesso!', 'success'); return redirect(url_for('dashboard'))
     return render_template('add_product.html')
 
 @app.route('/product/<int:product_id>/edit', methods=['GET', 'POST'])
@@ -700,13 +2117,17 @@ def edit_product(product_id):
         for img_id in images_to_delete:
             image_to_delete = db.session.get(ProductImage, img_id)
             if image_to_delete and image_to_delete.product_id == product.id: db.session.delete(image_to_delete)
-        new_images = request.files.getlist('product_images')
-        for image_file in new_images:
+        new_images = []
+        for image_file in request.files.getlist('product_images'):
             if image_file and allowed_file(image_file.filename, ALLOWED_IMG_EXTENSIONS):
                 filename=secure_filename(image_file.filename); image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                 new_image = ProductImage(filename=filename, product_id=product.id)
-                db.session.add(new_image)
-        db.session.commit(); flash('Produto atualizado!', 'success')
+                db.session.add(new_image); new_images.append(new_image)
+        product.updated_at = datetime.utcnow() # imagens incluídas ou removidas não alteram a linha do produto
+        sync_product_search(product)
+        db.session.commit(); product_saved(product)
+        for image in new_images: process_image.delay('product_image', image.id)
+        flash('Produto atualizado!', 'success')
         if session.get('is_admin'): return redirect(url_for('admin.products'))
         return redirect(url_for('dashboard'))
     return render_template('edit_product.html', product=product)
@@ -717,34 +2138,119 @@ def delete_product(product_id):
     product = db.session.get(Product, product_id)
     if product.supplier_id != session['company_id'] and not session.get('is_admin'):
         flash('Você não tem permissão para excluir este produto.', 'error'); return redirect(url_for('dashboard'))
-    db.session.delete(product); db.session.commit(); flash('Produto excluído!', 'success')
+    remove_product_search(product.id)
+    # As avaliações das cotações do produto são excluídas em cascata: um UPDATE por (fornecedor, nota)
+    removed = (db.session.query(Review.supplier_id, Review.rating, func.count(Review.id)).join(QuoteRequest, Review.quote_id == QuoteRequest.id)
+               .filter(QuoteRequest.product_id == product.id).group_by(Review.supplier_id, Review.rating).all())
+    for supplier_id, rating, count in removed: update_supplier_rating(supplier_id, rating, -count)
+    forget_product_quotes_stats(product.id)
+    supplier_id = product.supplier_id; touch_company(supplier_id)
+    db.session.delete(product); db.session.commit(); product_deleted(product_id); supplier_reviews_changed(supplier_id); flash('Produto excluído!', 'success')
     return redirect(request.referrer or url_for('dashboard'))
 
 @app.route('/notifications')
 @login_required
 def notifications():
-    company = db.session.get(Company, session['company_id'])
-    for n in company.notifications: n.read = True
+    company_id = session['company_id']
+    Notification.query.filter_by(recipient_id=company_id, read=False).update({Notification.read: True}, synchronize_session=False)
     db.session.commit()
-    notifications = Notification.query.filter_by(recipient_id=company.id).order_by(Notification.timestamp.desc()).all()
-    return render_template('notifications.html', notifications=notifications)
+    unread_counter.set(company_id, 0)
+    notifications, next_cursor = notification_page(company_id)
+    return render_template('notifications.html', notifications=notifications, next_cursor=next_cursor)
+
+@app.route('/notifications/feed')
+@login_required
+def notifications_feed():
+    """Próximas páginas do feed de notificações (rolagem infinita)."""
+    notifications, next_cursor = notification_page(session['company_id'], request.args.get('before'))
+    return jsonify({
+        'notifications': [{'message': n.message, 'link': n.link, 'timestamp': n.timestamp.strftime('%d/%m/%Y às %H:%M')} for n in notifications],
+        'next_cursor': next_cursor
+    })
 
 @app.route('/export/quotes')
 @login_required
 def export_quotes():
-    company = db.session.get(Company, session['company_id'])
-    quotes_query = company.sent_quotes if company.user_type == 'buyer' else company.received_quotes
-    quotes = quotes_query.options(joinedload(QuoteRequest.product), joinedload(QuoteRequest.buyer), joinedload(QuoteRequest.supplier)).all()
-    def generate():
-        data = StringIO(); writer = csv.writer(data)
-        writer.writerow(['ID', 'Produto', 'Status', 'Qtd', 'Preço Ofertado', 'Comprador', 'Fornecedor', 'Data'])
-        yield data.getvalue(); data.seek(0); data.truncate(0)
-        for quote in quotes:
-            writer.writerow([quote.id, quote.product.name, quote.status, quote.quantity, quote.offered_price, quote.buyer.company_name, quote.supplier.company_name, quote.timestamp.strftime('%Y-%m-%d %H:%M:%S')])
-            yield data.getvalue(); data.seek(0); data.truncate(0)
-    response = Response(generate(), mimetype='text/csv')
-    response.headers.set("Content-Disposition", "attachment", filename="relatorio_cotacoes.csv")
-    return response
+    # Só as colunas do relatório, sem montar objetos; a ordem segue os índices (comprador/fornecedor, timestamp, id)
+    buyer = aliased(Company); supplier = aliased(Company)
+    owner_column = QuoteRequest.buyer_id if session['user_type'] == 'buyer' else QuoteRequest.supplier_id
+    query = (db.session.query(QuoteRequest.id, Product.name.label('product_name'), QuoteRequest.status, QuoteRequest.quantity, QuoteRequest.offered_price,
+                              buyer.company_name.label('buyer_name'), supplier.company_name.label('supplier_name'), QuoteRequest.timestamp)
+             .join(Product, QuoteRequest.product_id == Product.id).join(buyer, QuoteRequest.buyer_id == buyer.id).join(supplier, QuoteRequest.supplier_id == supplier.id)
+             .filter(owner_column == session['company_id']).order_by(QuoteRequest.timestamp, QuoteRequest.id))
+    return csv_download(query, 'relatorio_cotacoes.csv', [
+        ('ID', lambda r: r.id), ('Produto', lambda r: r.product_name), ('Status', lambda r: r.status), ('Qtd', lambda r: r.quantity), ('Preço Ofertado', lambda r: r.offered_price),
+        ('Comprador', lambda r: r.buyer_name), ('Fornecedor', lambda r: r.supplier_name), ('Data', lambda r: format_timestamp(r.timestamp))],
+        compress=request.args.get('format') == 'gz')
+
+@app.route('/exports', methods=['GET', 'POST'])
+@login_required
+def exports():
+    company_id = session['company_id']
+    if request.method == 'POST':
+        report = request.form.get('report'); file_format = request.form.get('file_format')
+        filters = {key: request.form.get(key, '').strip() for key in ('date_from', 'date_to', 'status')}
+        try:
+            for key in ('date_from', 'date_to'):
+                if filters[key]: datetime.strptime(filters[key], '%Y-%m-%d')
+        except ValueError: filters = None
+        if report not in EXPORT_REPORTS or file_format not in export_formats() or filters is None or (filters['status'] and filters['status'] not in EXPORT_REPORTS[report]['statuses']):
+            flash('Pedido de relatório inválido.', 'error'); return redirect(url_for('exports'))
+        filters_json = json.dumps({key: value for key, value in filters.items() if value}, sort_keys=True)
+        # O mesmo relatório ainda válido (ou em andamento, se não estiver parado há mais de EXPORT_STALE_AFTER) é reaproveitado em vez de ser gerado de novo
+        cached = ExportJob.query.filter(ExportJob.company_id == company_id, ExportJob.report == report, ExportJob.file_format == file_format, ExportJob.filters == filters_json,
+                                        or_(and_(ExportJob.status.in_(('Na fila', 'Gerando')), ExportJob.created_at > export_stale_cutoff()), and_(ExportJob.status == 'Concluído', ExportJob.expires_at > datetime.utcnow()))).first()
+        if cached: flash('Este relatório já está disponível ou sendo gerado.', 'info'); return redirect(url_for('exports'))
+        job = ExportJob(company_id=company_id, report=report, file_format=file_format, filters=filters_json)
+        db.session.add(job); db.session.commit()
+        run_export_job.delay(job.id)
+        flash('Relatório solicitado! Você será avisado quando ele estiver pronto.', 'success'); return redirect(url_for('exports'))
+    jobs = ExportJob.query.filter_by(company_id=company_id).order_by(ExportJob.created_at.desc()).limit(20).all()
+    return render_template('exports.html', jobs=jobs, reports=EXPORT_REPORTS, formats=export_formats(), now=datetime.utcnow())
+
+@app.route('/exports/<int:job_id>/status')
+@login_required
+def export_status(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if not job or job.company_id != session['company_id']: return jsonify({'error': 'Relatório não encontrado.'}), 404
+    return jsonify(export_job_payload(job))
+
+@app.route('/exports/<int:job_id>/download')
+@login_required
+def download_export(job_id):
+    job = db.session.get(ExportJob, job_id)
+    if not job or job.company_id != session['company_id']: flash('Relatório não encontrado.', 'error'); return redirect(url_for('exports'))
+    if job.status != 'Concluído' or job.expires_at <= datetime.utcnow(): flash('Este relatório expirou ou ainda não está pronto.', 'error'); return redirect(url_for('exports'))
+    return send_protected_file(app.config['EXPORT_FOLDER'], job.filename)
+
+@app.route('/products/import', methods=['GET', 'POST'])
+@login_required
+@supplier_required
+def import_products():
+    company_id = session['company_id']
+    if not catalog_import_enabled(): flash('A importação de catálogo não está disponível neste servidor.', 'error'); return redirect(url_for('dashboard'))
+    if request.method == 'POST':
+        catalog = request.files.get('catalog'); images = request.files.get('images')
+        extensions = {'csv', 'xlsx'} if openpyxl else {'csv'}
+        if not catalog or not allowed_file(catalog.filename, extensions): flash(f"Envie a planilha em {' ou '.join(sorted(extensions)).upper()}.", 'error'); return redirect(url_for('import_products'))
+        if images and images.filename and not allowed_file(images.filename, {'zip'}): flash('As imagens devem ser enviadas em um arquivo .zip.', 'error'); return redirect(url_for('import_products'))
+        job = ImportJob(company_id=company_id); db.session.add(job); db.session.flush()
+        os.makedirs(app.config['IMPORT_FOLDER'], exist_ok=True)
+        job.filename = f"catalogo_{job.id}.{catalog.filename.rsplit('.', 1)[1].lower()}"; catalog.save(os.path.join(app.config['IMPORT_FOLDER'], job.filename))
+        if images and images.filename:
+            job.images_filename = f"imagens_{job.id}.zip"; images.save(os.path.join(app.config['IMPORT_FOLDER'], job.images_filename))
+        db.session.commit()
+        run_catalog_import.delay(job.id)
+        flash('Importação iniciada! Acompanhe o progresso abaixo.', 'success'); return redirect(url_for('import_products'))
+    jobs = ImportJob.query.filter_by(company_id=company_id).order_by(ImportJob.created_at.desc()).limit(10).all()
+    return render_template('import_products.html', jobs=jobs, xlsx_enabled=openpyxl is not None)
+
+@app.route('/products/import/<int:job_id>/status')
+@login_required
+def import_status(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if not job or job.company_id != session['company_id']: return jsonify({'error': 'Importação não encontrada.'}), 404
+    return jsonify(import_job_payload(job))
 
 # --- Blueprint do Admin ---
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -756,20 +2262,75 @@ def index():
 @admin_bp.route('/chart_data')
 @admin_required
 def chart_data():
+    # Só conta cadastros por mês: muda quando uma empresa é criada
+    etag, not_modified = conditional_etag(tuple(db.session.query(func.count(Company.id), func.max(Company.id)).one()))
+    if not_modified: return not_modified
     user_counts = db.session.query(func.strftime('%Y-%m', Company.created_at).label('month'),func.count(Company.id).label('count')).group_by('month').order_by('month').all()
     labels = [row.month for row in user_counts]; data = [row.count for row in user_counts]
-    return jsonify({'labels': labels, 'data': data})
+    return with_etag(jsonify({'labels': labels, 'data': data}), etag)
+@admin_bp.route('/cache_stats')
+@admin_required
+def cache_stats():
+    return jsonify(fragment_cache.stats())
+def encode_sort_cursor(value, row_id):
+    """Cursor das listagens do admin: valor da coluna de ordenação + id, em base64 (aceita texto, número ou data)."""
+    if isinstance(value, datetime): value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+def decode_sort_cursor(cursor, column):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(column.type, db.DateTime): value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (AttributeError, TypeError, ValueError): return None
+# Valor que substitui o nulo nas colunas de ordenação que aceitam nulo (menor que qualquer valor real): a ordenação e
+# o cursor usam coalesce(coluna, valor), senão o cursor guardaria null e a comparação por tupla perderia linhas
+ADMIN_SORT_NULL_VALUES = {db.DateTime: datetime.min, db.String: ''}
+def admin_listing(query, sort_options, default_sort, id_column):
+    """
+    Ordena (?sort=campo, ou -campo para decrescente) e pagina por cursor (?after=) uma listagem do admin.
+    'sort_options' mapeia o nome do campo para a coluna; o campo precisa estar entre as colunas selecionadas.
+    Retorna (linhas, cursor da próxima página ou None, ordenação aplicada).
+    """
+    sort = request.args.get('sort', default_sort)
+    if sort.lstrip('-') not in sort_options: sort = default_sort
+    key = sort.lstrip('-'); descending = sort.startswith('-'); column = sort_options[key]
+    null_value = next((value for kind, value in ADMIN_SORT_NULL_VALUES.items() if isinstance(column.type, kind)), None) if column.expression.nullable else None
+    sort_column = func.coalesce(column, null_value) if null_value is not None else column
+    cursor = request.args.get('after')
+    position = decode_sort_cursor(cursor, column) if cursor else None
+    if position:
+        query = query.filter(tuple_(sort_column, id_column) < position if descending else tuple_(sort_column, id_column) > position)
+    ordering = (sort_column.desc(), id_column.desc()) if descending else (sort_column.asc(), id_column.asc())
+    page_size = app.config['ADMIN_PAGE_SIZE']
+    rows = query.order_by(*ordering).limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]; value = getattr(rows[-1], key)
+        next_cursor = encode_sort_cursor(value if value is not None else null_value, rows[-1].id)
+    return rows, next_cursor, sort
 @admin_bp.route('/users')
 @admin_required
 def users():
-    all_users = Company.query.order_by(Company.company_name).all()
-    return render_template('admin/users.html', users=all_users)
+    filters = {'q': request.args.get('q', '').strip(), 'user_type': request.args.get('user_type', ''), 'status': request.args.get('status', '')}
+    query = db.session.query(Company.id, Company.company_name, Company.email, Company.cnpj, Company.user_type, Company.is_verified, Company.is_active, Company.is_admin, Company.created_at)
+    if filters['q']:
+        term = f"%{filters['q']}%"; query = query.filter(or_(Company.company_name.ilike(term), Company.email.ilike(term), Company.cnpj.ilike(term)))
+    if filters['user_type'] in ('buyer', 'supplier'): query = query.filter(Company.user_type == filters['user_type'])
+    if filters['status'] == 'active': query = query.filter(Company.is_active == True)
+    elif filters['status'] == 'suspended': query = query.filter(Company.is_active == False)
+    elif filters['status'] == 'unverified': query = query.filter(Company.is_verified == False)
+    if request.args.get('format') == 'csv':
+        return csv_download(query.order_by(Company.id), 'usuarios.csv', [
+            ('ID', lambda r: r.id), ('Empresa', lambda r: r.company_name), ('Email', lambda r: r.email), ('CNPJ', lambda r: r.cnpj), ('Tipo', lambda r: r.user_type),
+            ('Verificado', lambda r: 'Sim' if r.is_verified else 'Não'), ('Ativo', lambda r: 'Sim' if r.is_active else 'Não'), ('Cadastro', lambda r: format_timestamp(r.created_at))])
+    users, next_cursor, sort = admin_listing(query, {'company_name': Company.company_name, 'email': Company.email, 'created_at': Company.created_at}, 'company_name', Company.id)
+    return render_template('admin/users.html', users=users, next_cursor=next_cursor, sort=sort, filters=filters)
 @admin_bp.route('/user/<int:user_id>/toggle_verify', methods=['POST'])
 @admin_required
 def toggle_verify(user_id):
     user = db.session.get(Company, user_id)
     user.is_verified = not user.is_verified
-    db.session.commit(); flash(f"Status de verificação de {user.company_name} alterado.", "success")
+    db.session.commit(); company_changed(user); flash(f"Status de verificação de {user.company_name} alterado.", "success")
     return redirect(url_for('admin.users'))
 @admin_bp.route('/user/<int:user_id>/toggle_active', methods=['POST'])
 @admin_required
@@ -783,27 +2344,61 @@ def toggle_active(user_id):
 @admin_bp.route('/products')
 @admin_required
 def products():
-    all_products = Product.query.order_by(Product.id.desc()).all()
-    return render_template('admin/products.html', products=all_products)
+    filters = {'q': request.args.get('q', '').strip(), 'category': request.args.get('category', '')}
+    query = db.session.query(Product.id, Product.name, Product.category, Product.base_price, Product.supplier_id, Company.company_name.label('supplier_name')).join(Company, Product.supplier_id == Company.id)
+    if filters['q']:
+        term = f"%{filters['q']}%"; query = query.filter(or_(Product.name.ilike(term), Company.company_name.ilike(term)))
+    if filters['category']: query = query.filter(Product.category == filters['category'])
+    if request.args.get('format') == 'csv':
+        return csv_download(query.order_by(Product.id), 'produtos.csv', [
+            ('ID', lambda r: r.id), ('Produto', lambda r: r.name), ('Fornecedor', lambda r: r.supplier_name), ('Categoria', lambda r: r.category), ('Preço Base', lambda r: r.base_price)])
+    products, next_cursor, sort = admin_listing(query, {'id': Product.id, 'name': Product.name, 'category': Product.category}, '-id', Product.id)
+    categories = [row.category for row in db.session.query(Product.category).distinct().order_by(Product.category)]
+    return render_template('admin/products.html', products=products, next_cursor=next_cursor, sort=sort, filters=filters, categories=categories)
 @admin_bp.route('/reviews')
 @admin_required
 def reviews():
-    all_reviews = Review.query.order_by(Review.timestamp.desc()).all()
-    return render_template('admin/reviews.html', reviews=all_reviews)
+    filters = {'q': request.args.get('q', '').strip(), 'rating': request.args.get('rating', type=int)}
+    supplier = aliased(Company); reviewer = aliased(Company)
+    query = (db.session.query(Review.id, Review.rating, Review.comment, Review.timestamp, Review.supplier_id, Review.reviewer_id, QuoteRequest.product_id,
+                              Product.name.label('product_name'), supplier.company_name.label('supplier_name'), reviewer.company_name.label('reviewer_name'))
+             .join(QuoteRequest, Review.quote_id == QuoteRequest.id).join(Product, QuoteRequest.product_id == Product.id)
+             .join(supplier, Review.supplier_id == supplier.id).join(reviewer, Review.reviewer_id == reviewer.id))
+    if filters['q']:
+        term = f"%{filters['q']}%"; query = query.filter(or_(Review.comment.ilike(term), Product.name.ilike(term), supplier.company_name.ilike(term), reviewer.company_name.ilike(term)))
+    if filters['rating']: query = query.filter(Review.rating == filters['rating'])
+    if request.args.get('format') == 'csv':
+        return csv_download(query.order_by(Review.id), 'avaliacoes.csv', [
+            ('ID', lambda r: r.id), ('Produto', lambda r: r.product_name), ('Fornecedor', lambda r: r.supplier_name), ('Avaliador', lambda r: r.reviewer_name),
+            ('Nota', lambda r: r.rating), ('Comentário', lambda r: r.comment or ''), ('Data', lambda r: format_timestamp(r.timestamp))])
+    reviews, next_cursor, sort = admin_listing(query, {'timestamp': Review.timestamp, 'rating': Review.rating}, '-timestamp', Review.id)
+    return render_template('admin/reviews.html', reviews=reviews, next_cursor=next_cursor, sort=sort, filters=filters)
 @admin_bp.route('/review/<int:review_id>/delete', methods=['POST'])
 @admin_required
 def delete_review(review_id):
-    review = db.session.get(Review, review_id)
-    db.session.delete(review); db.session.commit(); flash('Avaliação removida com sucesso.', 'success')
+    review = db.session.get(Review, review_id); supplier_id = review.supplier_id
+    update_supplier_rating(supplier_id, review.rating, -1); touch_company(supplier_id)
+    db.session.delete(review); db.session.commit(); supplier_reviews_changed(supplier_id); flash('Avaliação removida com sucesso.', 'success')
     return redirect(url_for('admin.reviews'))
 @admin_bp.route('/quotes')
 @admin_required
 def quotes():
-    status_filter = request.args.get('status_filter', '')
-    query = QuoteRequest.query
-    if status_filter: query = query.filter(QuoteRequest.status == status_filter)
-    all_quotes = query.order_by(QuoteRequest.timestamp.desc()).all()
-    return render_template('admin/quotes.html', quotes=all_quotes, current_filter=status_filter)
+    filters = {'q': request.args.get('q', '').strip(), 'status_filter': request.args.get('status_filter', '')}
+    buyer = aliased(Company); supplier = aliased(Company)
+    query = (db.session.query(QuoteRequest.id, QuoteRequest.status, QuoteRequest.quantity, QuoteRequest.offered_price, QuoteRequest.timestamp,
+                              Product.name.label('product_name'), buyer.company_name.label('buyer_name'), supplier.company_name.label('supplier_name'))
+             .join(Product, QuoteRequest.product_id == Product.id).join(buyer, QuoteRequest.buyer_id == buyer.id).join(supplier, QuoteRequest.supplier_id == supplier.id))
+    if filters['q']:
+        term = f"%{filters['q']}%"; conditions = [Product.name.ilike(term), buyer.company_name.ilike(term), supplier.company_name.ilike(term)]
+        if filters['q'].lstrip('#').isdigit(): conditions.append(QuoteRequest.id == int(filters['q'].lstrip('#')))
+        query = query.filter(or_(*conditions))
+    if filters['status_filter'] in QUOTE_STATUSES: query = query.filter(QuoteRequest.status == filters['status_filter'])
+    if request.args.get('format') == 'csv':
+        return csv_download(query.order_by(QuoteRequest.id), 'cotacoes.csv', [
+            ('ID', lambda r: r.id), ('Produto', lambda r: r.product_name), ('Status', lambda r: r.status), ('Qtd', lambda r: r.quantity), ('Preço Ofertado', lambda r: r.offered_price),
+            ('Comprador', lambda r: r.buyer_name), ('Fornecedor', lambda r: r.supplier_name), ('Data', lambda r: format_timestamp(r.timestamp))])
+    quotes, next_cursor, sort = admin_listing(query, {'timestamp': QuoteRequest.timestamp, 'id': QuoteRequest.id}, '-timestamp', QuoteRequest.id)
+    return render_template('admin/quotes.html', quotes=quotes, next_cursor=next_cursor, sort=sort, filters=filters, statuses=QUOTE_STATUSES)
 @admin_bp.route('/announcements')
 @admin_required
 def announcements():
@@ -816,7 +2411,7 @@ def new_announcement():
         title = request.form.get('title'); content = request.form.get('content')
         if not title or not content: flash('Título e conteúdo são obrigatórios.', 'error'); return redirect(url_for('admin.new_announcement'))
         new_ann = Announcement(title=title, content=content)
-        db.session.add(new_ann); db.session.commit(); flash('Anúncio criado com sucesso.', 'success')
+        db.session.add(new_ann); db.session.commit(); fragment_cache.delete('announcement', 'active'); flash('Anúncio criado com sucesso.', 'success')
         return redirect(url_for('admin.announcements'))
     return render_template('admin/announcement_form.html', form_title="Novo Anúncio")
 @admin_bp.route('/announcement/<int:announcement_id>/edit', methods=['GET', 'POST'])
@@ -825,14 +2420,14 @@ def edit_announcement(announcement_id):
     announcement = db.session.get(Announcement, announcement_id)
     if request.method == 'POST':
         announcement.title = request.form.get('title'); announcement.content = request.form.get('content')
-        db.session.commit(); flash('Anúncio atualizado com sucesso.', 'success')
+        db.session.commit(); fragment_cache.delete('announcement', 'active'); flash('Anúncio atualizado com sucesso.', 'success')
         return redirect(url_for('admin.announcements'))
     return render_template('admin/announcement_form.html', form_title="Editar Anúncio", announcement=announcement)
 @admin_bp.route('/announcement/<int:announcement_id>/delete', methods=['POST'])
 @admin_required
 def delete_announcement(announcement_id):
     announcement = db.session.get(Announcement, announcement_id)
-    db.session.delete(announcement); db.session.commit(); flash('Anúncio excluído com sucesso.', 'success')
+    db.session.delete(announcement); db.session.commit(); fragment_cache.delete('announcement', 'active'); flash('Anúncio excluído com sucesso.', 'success')
     return redirect(url_for('admin.announcements'))
 @admin_bp.route('/announcement/<int:announcement_id>/toggle', methods=['POST'])
 @admin_required
@@ -840,12 +2435,148 @@ def toggle_announcement(announcement_id):
     announcement = db.session.get(Announcement, announcement_id)
     if not announcement.is_active: Announcement.query.update({Announcement.is_active: False})
     announcement.is_active = not announcement.is_active
-    db.session.commit(); flash('Status do anúncio alterado com sucesso.', 'success')
+    db.session.commit(); fragment_cache.delete('announcement', 'active'); flash('Status do anúncio alterado com sucesso.', 'success')
     return redirect(url_for('admin.announcements'))
 app.register_blueprint(admin_bp)
 
 # --- EVENTOS DO SOCKET.IO PARA O CHAT ---
 
+class ChatWriter:
+    """
+    Gravação das mensagens do chat em lote (write-behind). on_send_message só enfileira a
+    mensagem; uma tarefa de fundo grava tudo o que acumulou, de todas as salas, em um único
+    INSERT + commit a cada CHAT_FLUSH_INTERVAL segundos. A fila é limitada: quando enche,
+    quem enviou a mensagem grava o lote pendente na hora.
+
+    As mensagens já foram entregues na sala, então nunca são descartadas: se a gravação falha,
+    o lote fica pendente e é tentado de novo com espera crescente (até CHAT_FLUSH_MAX_BACKOFF).
+    Se o lote pendente passa do tamanho da fila, ou o processo termina com ele, as mensagens vão
+    para CHAT_SPILL_FILE (uma por linha, em JSON), que é gravado no banco antes do próximo lote.
+    O arquivo é compartilhado pelos processos do app: leitura, gravação no banco e remoção
+    acontecem com uma trava (flock) em CHAT_SPILL_FILE + '.lock'.
+
+    Se o lote é recusado pelo banco por causa de uma linha (cotação excluída, texto longo demais),
+    as mensagens são gravadas uma a uma e as recusadas vão para CHAT_DEAD_LETTER_FILE, para que
+    uma mensagem ruim não segure as das outras salas.
+    """
+
+    def __init__(self, interval, max_size, max_backoff, spill_path, dead_letter_path):
+        self.interval = interval; self.max_size = max_size; self.max_backoff = max_backoff
+        self.spill_path = spill_path; self.dead_letter_path = dead_letter_path
+        self._queue = queue.Queue(maxsize=max_size)
+        self._pending = []  # lote que falhou (ou que não coube na fila), aguardando nova tentativa
+        self._failures = 0; self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._started = False
+
+    def put(self, row):
+        if not self._started:
+            self._started = True; socketio.start_background_task(self._run)
+        try: self._queue.put_nowait(row); return
+        except queue.Full: pass
+        self.flush()
+        try: self._queue.put_nowait(row)
+        except queue.Full:
+            # Outras tarefas encheram a fila de novo depois do flush: a mensagem entra direto no lote pendente
+            with self._lock: self._pending.append(row)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    @contextmanager
+    def _spill_lock(self):
+        if fcntl is None: yield; return
+        with open(self.spill_path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _append_rows(path, rows):
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows: f.write(json.dumps(dict(row, timestamp=row['timestamp'].isoformat())) + '\n')
+
+    def _spill(self):
+        """Passa o lote pendente para o arquivo de contingência. Chamada com a trava do arquivo."""
+        self._append_rows(self.spill_path, self._pending)
+        app.logger.warning(f"Chat: {len(self._pending)} mensagens guardadas em {self.spill_path} até o banco voltar")
+        self._pending = []
+
+    def _spilled_rows(self):
+        try:
+            with open(self.spill_path, encoding='utf-8') as f:
+                return [dict(row, timestamp=datetime.fromisoformat(row['timestamp'])) for row in map(json.loads, f) if row]
+        except FileNotFoundError: return []
+
+    def flush(self, force=False):
+        """
+        Grava as mensagens pendentes e retorna quantas foram gravadas. Durante a espera depois de
+        uma falha não tenta de novo, a menos que 'force' seja verdadeiro.
+        """
+        with self._lock:
+            while True:
+                try: self._pending.append(self._queue.get_nowait())
+                except queue.Empty: break
+            if not force and time.monotonic() < self._retry_at:
+                if len(self._pending) > self.max_size:
+                    with self._spill_lock(): self._spill()
+                return 0
+            if not os.path.exists(self.spill_path): return self._write([])
+            with self._spill_lock(): return self._write(self._spilled_rows())
+
+    def _write(self, spilled):
+        """Grava as mensagens do arquivo de contingência ('spilled') e as pendentes. Chamada com as travas."""
+        rows = spilled + self._pending
+        if not rows: return 0
+        with app.app_context():
+            try:
+                db.session.execute(insert(ChatMessage), rows); db.session.commit()
+                saved, retry = len(rows), []
+            except (IntegrityError, DataError):
+                db.session.rollback()
+                app.logger.exception(f"Chat: lote de {len(rows)} mensagens recusado; gravando uma a uma")
+                saved, retry = self._write_one_by_one(rows)
+            except Exception:
+                db.session.rollback()
+                self._backoff(f"Chat: falha ao gravar {len(rows)} mensagens", exc_info=True)
+                if len(self._pending) > self.max_size: self._spill()
+                return 0
+        if spilled: os.remove(self.spill_path)
+        self._pending = retry
+        if retry: self._backoff(f"Chat: {len(retry)} mensagens não gravadas")
+        else: self._failures = 0; self._retry_at = 0.0
+        return saved
+
+    def _write_one_by_one(self, rows):
+        """Grava cada mensagem em sua própria transação. Retorna (gravadas, mensagens a tentar de novo)."""
+        saved = 0; retry = []; rejected = []
+        for row in rows:
+            try: db.session.execute(insert(ChatMessage), [row]); db.session.commit(); saved += 1
+            except (IntegrityError, DataError): db.session.rollback(); rejected.append(row)
+            except Exception: db.session.rollback(); retry.append(row)
+        if rejected:
+            self._append_rows(self.dead_letter_path, rejected)
+            app.logger.error(f"Chat: {len(rejected)} mensagens recusadas pelo banco guardadas em {self.dead_letter_path}")
+        return saved, retry
+
+    def _backoff(self, message, exc_info=False):
+        self._failures += 1; delay = min(self.interval * 2 ** self._failures, self.max_backoff)
+        self._retry_at = time.monotonic() + delay
+        app.logger.error(f"{message}; nova tentativa em {delay:.1f}s", exc_info=exc_info)
+
+    def close(self):
+        """Na saída do processo: última tentativa de gravar; o que sobrar vai para o arquivo de contingência."""
+        self.flush(force=True)
+        with self._lock:
+            if self._pending:
+                with self._spill_lock(): self._spill()
+
+chat_writer = ChatWriter(app.config['CHAT_FLUSH_INTERVAL'], app.config['CHAT_WRITE_QUEUE_SIZE'], app.config['CHAT_FLUSH_MAX_BACKOFF'],
+                         app.config['CHAT_SPILL_FILE'], app.config['CHAT_DEAD_LETTER_FILE'])
+atexit.register(chat_writer.close)
+
 @socketio.on('connect')
 def on_connect():
     """
@@ -863,6 +2594,15 @@ def on_join(data):
     room = f"quote_{data['quote_id']}"
     join_room(room)
 
+@socketio.on('load_history')
+def on_load_history(data):
+    """Envia só para quem pediu a página de mensagens anterior ao cursor 'before'."""
+    quote_id = str(data.get('quote_id', ''))
+    if 'company_id' not in session or not quote_id.isdigit() or not is_chat_participant(int(quote_id), session['company_id']): return
+    quote_id = int(quote_id)
+    messages, next_cursor = chat_history_page(quote_id, data.get('before'))
+    emit('history', {'messages': [chat_message_payload(m) for m in messages], 'next_cursor': next_cursor})
+
 @socketio.on('typing')
 def on_typing(data):
     room = f"quote_{data['quote_id']}"
@@ -875,11 +2615,16 @@ def on_stop_typing(data):
 
 @socketio.on('send_message')
 def on_send_message(data):
-    quote_id = data['quote_id']
+    # Só quem participa da cotação manda mensagem (e a gravação em lote não recebe cotação inexistente)
+    quote_id = str(data.get('quote_id', ''))
+    if 'company_id' not in session or not quote_id.isdigit() or not is_chat_participant(int(quote_id), session['company_id']): return
+    quote_id = int(quote_id)
     message_text = data.get('message')
     room = f"quote_{quote_id}"
     
     attachment_filename = data.get('attachment')
+    # O anexo precisa ter sido enviado para esta cotação (senão daria acesso a arquivos de outra)
+    if attachment_filename and (len(attachment_filename) > 255 or chat_attachment_quote_id(attachment_filename) != quote_id): return
     attachment_type = None
     if attachment_filename:
         if '.' in attachment_filename:
@@ -892,39 +2637,45 @@ def on_send_message(data):
     if not message_text and not attachment_filename:
         return # Não envia mensagem vazia
 
-    new_message = ChatMessage(
-        message=message_text,
-        quote_id=quote_id,
-        sender_id=session['company_id'],
-        attachment_filename=attachment_filename,
-        attachment_type=attachment_type
-    )
-    db.session.add(new_message)
-    db.session.commit()
+    # A mensagem vai para a sala imediatamente; a gravação no banco fica com o chat_writer
+    timestamp = datetime.utcnow()
+    chat_writer.put({
+        'message': message_text,
+        'quote_id': quote_id,
+        'sender_id': session['company_id'],
+        'attachment_filename': attachment_filename,
+        'attachment_type': attachment_type,
+        'timestamp': timestamp
+    })
 
     message_payload = {
-        'message': new_message.message,
-        'sender_name': new_message.sender.company_name,
-        'timestamp': new_message.timestamp.strftime('%d/%m/%Y %H:%M'),
-        'attachment_filename': new_message.attachment_filename,
-        'attachment_type': new_message.attachment_type
+        'message': message_text,
+        'sender_name': session['company_name'],
+        'timestamp': timestamp.strftime('%d/%m/%Y %H:%M'),
+        'attachment_filename': attachment_filename,
+        'attachment_type': attachment_type
     }
     send(message_payload, to=room)
 
 @app.route('/chat/upload', methods=['POST'])
 @login_required
 def upload_chat_file():
+    quote_id = request.form.get('quote_id', '')
+    if not quote_id.isdigit() or not is_chat_participant(int(quote_id), session['company_id']):
+        return jsonify({'error': 'Acesso não permitido.'}), 403
     if 'file' not in request.files:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'Nome de arquivo vazio'}), 400
     if file and allowed_file(file.filename, ALLOWED_ATTACH_EXTENSIONS):
-        filename = secure_filename(f"{datetime.utcnow().timestamp()}_{file.filename}")
+        filename = secure_filename(f"q{quote_id}_{datetime.utcnow().timestamp()}_{file.filename}") # prefixo com a cotação: ver chat_attachment_quote_id
+        os.makedirs(app.config['CHAT_ATTACHMENT_FOLDER'], exist_ok=True)
         file.save(os.path.join(app.config['CHAT_ATTACHMENT_FOLDER'], filename))
         return jsonify({'filename': filename})
     return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
 
 # --- Execução da Aplicação ---
 if __name__ == '__main__':
+    with app.app_context(): load_autocomplete_index()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -22,8 +22,45 @@ class Config:
 
     # Configuração de Uploads
     UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads')
-    ATTACHMENT_FOLDER = os.path.join(basedir, 'static', 'attachments')
-    CHAT_ATTACHMENT_FOLDER = os.path.join(basedir, 'static', 'chat_attachments') # ADICIONADO
+    # Anexos das cotações e do chat ficam fora de static/: só saem pelas rotas que checam se o usuário participa
+    # da cotação (arquivos de instalações antigas em static/ são movidos com "flask move-attachments")
+    ATTACHMENT_FOLDER = os.environ.get('ATTACHMENT_FOLDER') or os.path.join(basedir, 'attachments')
+    CHAT_ATTACHMENT_FOLDER = os.environ.get('CHAT_ATTACHMENT_FOLDER') or os.path.join(basedir, 'chat_attachments')
+    # Quem transfere os anexos depois da checagem de acesso:
+    #   'direct'     - o próprio Flask (com suporte a Range e requisições condicionais)
+    #   'x-accel'    - o nginx, via X-Accel-Redirect para DOWNLOAD_ACCEL_PREFIX + caminho relativo a
+    #                  DOWNLOAD_ACCEL_ROOT; ex.: location /protected/ { internal; alias <basedir>/; }
+    #   'x-sendfile' - Apache (mod_xsendfile) ou lighttpd, via X-Sendfile com o caminho absoluto
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD') or 'direct'
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX') or '/protected/'
+    DOWNLOAD_ACCEL_ROOT = os.environ.get('DOWNLOAD_ACCEL_ROOT') or basedir
+    # Relatórios gerados pelo worker (fora de static/, só saem pela rota de download);
+    # lidos do banco em lotes de EXPORT_BATCH_SIZE e apagados EXPORT_FILE_TTL segundos depois de prontos
+    EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER') or os.path.join(basedir, 'exports')
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 5000)
+    EXPORT_FILE_TTL = int(os.environ.get('EXPORT_FILE_TTL') or 86400)
+    # Pedidos que não saem de 'Na fila'/'Gerando' nesse tempo (worker caiu) deixam de bloquear um novo pedido igual
+    EXPORT_STALE_AFTER = int(os.environ.get('EXPORT_STALE_AFTER') or 3600)
+    # Importação de catálogo: planilhas e zips enviados ficam em IMPORT_FOLDER até o worker processá-los;
+    # cada lote de IMPORT_BATCH_SIZE linhas é gravado com um INSERT/UPDATE em lote e um commit
+    IMPORT_FOLDER = os.environ.get('IMPORT_FOLDER') or os.path.join(basedir, 'imports')
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE') or 500)
+    IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS') or 200) # Linhas com erro guardadas para exibição
+    IMPORT_MAX_IMAGE_SIZE = int(os.environ.get('IMPORT_MAX_IMAGE_SIZE') or 10 * 1024 * 1024)
+    # Larguras (px) das miniaturas WebP/AVIF geradas pelo worker para imagens de produto e logos
+    IMAGE_VARIANT_WIDTHS = [int(w) for w in (os.environ.get('IMAGE_VARIANT_WIDTHS') or '160,320,640').split(',')]
+    IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY') or 75)
+
+    # Arquivos estáticos com hash no nome (gerados por "flask build-assets") ficam em cache
+    # no navegador por este tempo (s), sem revalidação
+    STATIC_IMMUTABLE_MAX_AGE = int(os.environ.get('STATIC_IMMUTABLE_MAX_AGE') or 31536000)
+    # Respostas HTML/JSON a partir deste tamanho (bytes) são comprimidas com brotli ou gzip,
+    # conforme o Accept-Encoding; níveis baixos priorizam a latência
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL') or 6)
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY') or 5)
+    # Linhas lidas do banco (e escritas na resposta) por vez nas exportações em CSV
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 1000)
 
     # Configuração de E-mail (LÊ DO ARQUIVO .env)
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
@@ -32,8 +69,86 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = ('Connecta B2B', MAIL_USERNAME)
+    # Endereço público do site, usado nos links dos e-mails montados pelo worker
+    EMAIL_BASE_URL = os.environ.get('EMAIL_BASE_URL') or 'http://localhost:5000'
+    # Envio em lote pelo worker: a conexão SMTP é reaberta a cada MAIL_MAX_EMAILS mensagens;
+    # MAIL_RATE_LIMIT é o limite de envios por segundo de cada processo do worker (divida a cota
+    # do provedor pelo número de processos); falhas temporárias são repetidas até MAIL_MAX_RETRIES
+    # vezes, esperando MAIL_RETRY_BACKOFF * 2^tentativa segundos.
+    MAIL_MAX_EMAILS = int(os.environ.get('MAIL_MAX_EMAILS') or 100)
+    MAIL_RATE_LIMIT = float(os.environ.get('MAIL_RATE_LIMIT') or 10)
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE') or 50)
+    MAIL_BATCH_DELAY = float(os.environ.get('MAIL_BATCH_DELAY') or 2)
+    MAIL_MAX_RETRIES = int(os.environ.get('MAIL_MAX_RETRIES') or 5)
+    MAIL_RETRY_BACKOFF = int(os.environ.get('MAIL_RETRY_BACKOFF') or 30)
     
     # ADICIONADO: Configuração do Celery
     # (Presume que o Redis (broker) está rodando localmente na porta padrão)
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379/0'
-    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
\ No newline at end of file
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') or 'redis://localhost:6379/0'
+    # Tarefas periódicas (rode também "celery -A app.celery beat")
+    CELERYBEAT_SCHEDULE = {
+        'purge-expired-exports': {'task': 'app.purge_expired_exports', 'schedule': int(os.environ.get('EXPORT_PURGE_INTERVAL') or 900)},
+    }
+
+    # Socket.IO com vários processos atrás de um balanceador de carga.
+    # Os emits (notificações em user_<id>, chat em quote_<id>) passam por uma fila
+    # compartilhada para chegar aos clientes conectados em qualquer processo.
+    # Use o mesmo Redis do broker do Celery (ex.: redis://localhost:6379/0);
+    # "memory://" serve de substituto local em testes com um único processo.
+    # Sem valor, o app roda em um único processo (emits só chegam aos clientes locais).
+    #
+    # Requisito de sessão fixa (sticky session): o Socket.IO começa em long-polling,
+    # com várias requisições HTTP da mesma conexão, que precisam cair sempre no mesmo
+    # processo. Rode cada processo em uma porta própria (gunicorn -k eventlet -w 1 ...,
+    # que aplica o monkey patching exigido pela fila) e balanceie por cliente, por ex.
+    # "ip_hash" no upstream do nginx, repassando os cabeçalhos Upgrade/Connection
+    # em /socket.io/ para o WebSocket. Vários workers num mesmo gunicorn (-w > 1)
+    # não funcionam, pois o gunicorn não distribui as requisições de forma fixa.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    # Canal na fila; separa ambientes que compartilham o mesmo Redis
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL') or 'flask-socketio'
+
+    # Redis para caches e índices compartilhados entre processos.
+    # Se não for definido, cada processo usa apenas memória local (e a importação de catálogo, que
+    # roda no worker e precisa invalidar os caches dos processos web, fica desligada).
+    REDIS_URL = os.environ.get('REDIS_URL')
+
+    # Validade (s) do contador de notificações não lidas em cache
+    UNREAD_CACHE_TTL = int(os.environ.get('UNREAD_CACHE_TTL') or 86400)
+
+    # Notificações exibidas por página no feed
+    NOTIFICATIONS_PAGE_SIZE = int(os.environ.get('NOTIFICATIONS_PAGE_SIZE') or 20)
+
+    # Itens por página na caixa de cotações do painel
+    DASHBOARD_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE') or 20)
+
+    # Mensagens carregadas por vez no histórico do chat
+    CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE') or 50)
+
+    # Chat: intervalo (s) entre as gravações em lote e tamanho máximo da fila de mensagens a gravar
+    CHAT_FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL') or 0.5)
+    CHAT_WRITE_QUEUE_SIZE = int(os.environ.get('CHAT_WRITE_QUEUE_SIZE') or 10000)
+    # Chat: espera máxima (s) entre as novas tentativas quando a gravação falha, e arquivo onde as
+    # mensagens ainda não gravadas ficam guardadas se o banco seguir fora do ar (gravadas quando ele voltar;
+    # pode ser compartilhado pelos processos do app, que o acessam com trava em CHAT_SPILL_FILE + '.lock')
+    CHAT_FLUSH_MAX_BACKOFF = float(os.environ.get('CHAT_FLUSH_MAX_BACKOFF') or 30)
+    CHAT_SPILL_FILE = os.environ.get('CHAT_SPILL_FILE') or os.path.join(basedir, 'chat_spill.jsonl')
+    # Mensagens que o banco recusou uma a uma (cotação excluída, texto longo demais), guardadas para análise
+    CHAT_DEAD_LETTER_FILE = os.environ.get('CHAT_DEAD_LETTER_FILE') or os.path.join(basedir, 'chat_dead_letter.jsonl')
+
+    # Linhas por página nas listagens do painel administrativo
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE') or 50)
+
+    # Validade (s) das contagens do marketplace sem filtros (também invalidadas a cada alteração)
+    FACETS_CACHE_TTL = int(os.environ.get('FACETS_CACHE_TTL') or 300)
+
+    # Cache de fragmentos HTML (cartão do produto, cabeçalho e avaliações do fornecedor, aviso do painel).
+    # Eles são invalidados a cada alteração; a validade só limita o atraso quando a alteração vem de outro
+    # processo sem Redis (ex.: importação no worker). Sem Redis, cada processo guarda até FRAGMENT_CACHE_MAX_BYTES;
+    # com Redis, limite a memória no próprio servidor (maxmemory + allkeys-lru).
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL') or 600)
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES') or 32 * 1024 * 1024)
+
+    # Autocompletar: intervalo (s) para verificar se outro processo alterou produtos
+    AUTOCOMPLETE_SYNC_INTERVAL = int(os.environ.get('AUTOCOMPLETE_SYNC_INTERVAL') or 5)
@@ -90,9 +90,19 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text search structures (SQLite FTS5 table and its shadow tables,
+    # PostgreSQL GIN expression index) are created by hand in the migrations
+    # and are not part of the models
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == 'table' and name.startswith('product_fts'):
+            return False
+        return not (type_ == 'index' and name == 'ix_product_search')
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
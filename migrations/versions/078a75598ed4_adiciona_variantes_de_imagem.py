@@ -0,0 +1,32 @@
+"""Adiciona variantes de imagem
+
+Revision ID: 078a75598ed4
+Revises: 69898ddb22a6
+Create Date: 2026-10-17 16:20:41.502113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '078a75598ed4'
+down_revision = '69898ddb22a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('logo_variants', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('product_image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variants', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('product_image', schema=None) as batch_op:
+        batch_op.drop_column('variants')
+
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.drop_column('logo_variants')
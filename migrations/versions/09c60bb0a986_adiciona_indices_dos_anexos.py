@@ -0,0 +1,32 @@
+"""Adiciona índices dos anexos
+
+Revision ID: 09c60bb0a986
+Revises: 078a75598ed4
+Create Date: 2026-10-17 17:05:12.384906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '09c60bb0a986'
+down_revision = '078a75598ed4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_message_attachment_filename', ['attachment_filename'], unique=False)
+
+    with op.batch_alter_table('quote_request', schema=None) as batch_op:
+        batch_op.create_index('ix_quote_request_attachment_filename', ['attachment_filename'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('quote_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_quote_request_attachment_filename')
+
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_attachment_filename')
@@ -0,0 +1,55 @@
+"""Adiciona updated_at em produtos, empresas e avaliações (ETags)
+
+Revision ID: 2e9e077a0283
+Revises: b0179d51112d
+Create Date: 2026-10-17 21:05:37.218904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e9e077a0283'
+down_revision = 'b0179d51112d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('company', 'product', 'review'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Registros existentes: a data de criação quando houver, senão agora
+    op.execute("UPDATE company SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+    op.execute("UPDATE product SET updated_at = CURRENT_TIMESTAMP")
+    op.execute("UPDATE review SET updated_at = COALESCE(timestamp, CURRENT_TIMESTAMP)")
+
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_company_updated_at', ['updated_at'], unique=False)
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_product_updated_at', ['updated_at'], unique=False)
+
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_review_updated_at', ['updated_at'], unique=False)
+        batch_op.create_index('ix_review_supplier_updated', ['supplier_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('review', schema=None) as batch_op:
+        batch_op.drop_index('ix_review_supplier_updated')
+        batch_op.drop_index('ix_review_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.drop_index('ix_company_updated_at')
+        batch_op.drop_column('updated_at')
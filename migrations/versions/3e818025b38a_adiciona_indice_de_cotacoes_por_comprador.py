@@ -0,0 +1,26 @@
+"""Adiciona índice de cotações por comprador
+
+Revision ID: 3e818025b38a
+Revises: 09c60bb0a986
+Create Date: 2026-10-17 17:41:37.902215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e818025b38a'
+down_revision = '09c60bb0a986'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quote_request', schema=None) as batch_op:
+        batch_op.create_index('ix_quote_request_buyer_timestamp', ['buyer_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('quote_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_quote_request_buyer_timestamp')
@@ -0,0 +1,51 @@
+"""Adiciona agregado de avaliações por fornecedor
+
+Revision ID: 4d1dc6a14d7c
+Revises: d87c31c6d95d
+Create Date: 2026-10-17 10:03:54.118420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d1dc6a14d7c'
+down_revision = 'd87c31c6d95d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('supplier_rating',
+    sa.Column('supplier_id', sa.Integer(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.Integer(), nullable=False),
+    sa.Column('rating_1', sa.Integer(), nullable=False),
+    sa.Column('rating_2', sa.Integer(), nullable=False),
+    sa.Column('rating_3', sa.Integer(), nullable=False),
+    sa.Column('rating_4', sa.Integer(), nullable=False),
+    sa.Column('rating_5', sa.Integer(), nullable=False),
+    sa.Column('rating_avg', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['supplier_id'], ['company.id'], ),
+    sa.PrimaryKeyConstraint('supplier_id')
+    )
+    with op.batch_alter_table('supplier_rating', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_supplier_rating_rating_avg'), ['rating_avg'], unique=False)
+
+    # Preenche o agregado com as avaliações já existentes
+    op.execute(
+        "INSERT INTO supplier_rating (supplier_id, rating_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5, rating_avg) "
+        "SELECT supplier_id, COUNT(*), SUM(rating), "
+        "SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END), SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END), SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END), AVG(rating * 1.0) "
+        "FROM review GROUP BY supplier_id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('supplier_rating', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_supplier_rating_rating_avg'))
+
+    op.drop_table('supplier_rating')
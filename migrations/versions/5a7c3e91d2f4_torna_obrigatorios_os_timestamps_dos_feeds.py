@@ -0,0 +1,37 @@
+"""Torna obrigatórios os timestamps dos feeds paginados por cursor
+
+Revision ID: 5a7c3e91d2f4
+Revises: 2e9e077a0283
+Create Date: 2026-10-18 10:12:44.516203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c3e91d2f4'
+down_revision = '2e9e077a0283'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Registros antigos sem data: o grupo fica com a da primeira cotação dele; a notificação, com a de agora
+    op.execute("UPDATE quote_group SET timestamp = COALESCE((SELECT MIN(quote_request.timestamp) FROM quote_request "
+               "WHERE quote_request.group_id = quote_group.id), CURRENT_TIMESTAMP) WHERE timestamp IS NULL")
+    op.execute("UPDATE notification SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+
+    with op.batch_alter_table('quote_group', schema=None) as batch_op:
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('quote_group', schema=None) as batch_op:
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
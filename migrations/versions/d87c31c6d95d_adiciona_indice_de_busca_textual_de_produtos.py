@@ -0,0 +1,47 @@
+"""Adiciona índice de busca textual de produtos
+
+Revision ID: d87c31c6d95d
+Revises: 76d6f5bf1e81
+Create Date: 2026-10-17 09:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import search_document
+
+
+# revision identifiers, used by Alembic.
+revision = 'd87c31c6d95d'
+down_revision = '76d6f5bf1e81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE product_fts USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')")
+        # Peso 10 para o nome e 1 para a descrição na coluna 'rank'
+        op.execute("INSERT INTO product_fts (product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+        products = bind.execute(sa.text("SELECT id, name, description FROM product")).fetchall()
+        if products:
+            bind.execute(
+                sa.text("INSERT INTO product_fts (rowid, name, description) VALUES (:id, :name, :description)"),
+                [{'id': p.id, 'name': search_document(p.name), 'description': search_document(p.description)} for p in products]
+            )
+    elif bind.dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        op.execute("CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese)")
+        op.execute("ALTER TEXT SEARCH CONFIGURATION pt_unaccent ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem")
+        op.execute("CREATE INDEX ix_product_search ON product USING gin "
+                   "(to_tsvector('pt_unaccent', coalesce(name, '') || ' ' || coalesce(description, '')))")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS product_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_product_search")
+        op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS pt_unaccent")
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Normalização de texto para a busca do marketplace.
+
+Este módulo não depende do app (nem do banco) para poder ser usado tanto
+pelas rotas quanto pelas migrações do Alembic.
+"""
+
+import bisect
+import heapq
+import os
+import re
+import threading
+import unicodedata
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Sufixos mais comuns do português, do mais longo para o mais curto
+# (versão reduzida do stemmer RSLP). Os sufixos já estão sem acento.
+_PLURAL_SUFFIXES = (('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'), ('res', 'r'), ('ns', 'm'), ('s', ''))
+_NOUN_SUFFIXES = (
+    'amentos', 'imentos', 'amento', 'imento', 'adoras', 'adores', 'idades', 'mente',
+    'adora', 'ador', 'acao', 'idade', 'ivel', 'avel', 'ismo', 'ista', 'ante', 'ico', 'ica',
+)
+_VOWEL_SUFFIXES = ('a', 'e', 'o')
+_MIN_STEM = 3
+
+
+def normalize_text(text):
+    """Converte para minúsculas e remove os acentos ("Ação" -> "acao")."""
+    if not text: return ''
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem_pt(token):
+    """Reduz uma palavra (já normalizada) ao seu radical aproximado."""
+    if len(token) <= _MIN_STEM or token.isdigit(): return token
+    for suffix, replacement in _PLURAL_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) + len(replacement) >= _MIN_STEM:
+            token = token[:-len(suffix)] + replacement
+            break
+    for suffix in _NOUN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            return token[:-len(suffix)]
+    if token.endswith(_VOWEL_SUFFIXES) and len(token) - 1 >= _MIN_STEM:
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lista de palavras normalizadas (sem acento, em minúsculas)."""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def search_document(text):
+    """Texto gravado no índice FTS5: os radicais das palavras separados por espaço."""
+    return ' '.join(stem_pt(token) for token in tokenize(text))
+
+
+def fts5_match_expression(query):
+    """
+    Monta a expressão MATCH do FTS5 para o texto digitado pelo comprador.
+    Todas as palavras precisam aparecer (AND) e a última aceita prefixo,
+    para que "empilhad" encontre "empilhadeira". Retorna None se não houver termos.
+    """
+    terms = [stem_pt(token) for token in tokenize(query)]
+    if not terms: return None
+    parts = [f'"{term}"' for term in terms]
+    parts[-1] += '*'
+    return ' '.join(parts)
+
+
+def tsquery_expression(query):
+    """Equivalente de fts5_match_expression para o to_tsquery do PostgreSQL."""
+    terms = tokenize(query)
+    if not terms: return None
+    parts = [f"'{term}'" for term in terms]
+    parts[-1] += ':*'
+    return ' & '.join(parts)
+
+
+class PrefixIndex:
+    """
+    Índice de prefixos em memória para o autocompletar (lista ordenada + bisect).
+
+    Cada produto é indexado pelo nome normalizado a partir de cada palavra
+    ("barra de aco", "de aco", "aco"), para que "aco" encontre "Barra de Aço".
+    Os resultados são ordenados por popularidade (número de cotações).
+    """
+
+    MAX_CACHED_PREFIXES = 10000
+    MAX_RANKED = 50  # ids guardados por prefixo (sobra para descartar nomes repetidos)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []  # [(chave normalizada, product_id)], ordenada
+        self._names = {}  # product_id -> nome exibido
+        self._popularity = {}  # product_id -> número de cotações
+        self._results = {}  # prefixo -> ids já ordenados (descartado a cada alteração)
+        self.built = False
+        self._generation = None; self._changes = 0  # ver version
+
+    @staticmethod
+    def _keys(name):
+        words = tokenize(name)
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def build(self, products, popularity):
+        """Reconstrói o índice a partir de pares (product_id, nome)."""
+        names = {}; entries = []
+        for product_id, name in products:
+            names[product_id] = name
+            entries.extend((key, product_id) for key in self._keys(name))
+        entries.sort()
+        with self._lock:
+            self._entries, self._names, self._popularity = entries, names, dict(popularity)
+            self._results = {}; self.built = True
+            self._generation = os.urandom(4).hex(); self._changes = 0
+
+    def add(self, product_id, name):
+        """Inclui ou atualiza um produto."""
+        with self._lock:
+            self._remove(product_id)
+            self._names[product_id] = name
+            for key in self._keys(name): bisect.insort(self._entries, (key, product_id))
+            self._results = {}; self._changes += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+            self._results = {}; self._changes += 1
+
+    def _remove(self, product_id):
+        name = self._names.pop(product_id, None)
+        if name is None: return
+        for key in self._keys(name):
+            i = bisect.bisect_left(self._entries, (key, product_id))
+            if i < len(self._entries) and self._entries[i] == (key, product_id): del self._entries[i]
+
+    def bump(self, product_id, amount=1):
+        """Soma 'amount' à popularidade do produto (ex.: nova cotação)."""
+        with self._lock:
+            self._popularity[product_id] = self._popularity.get(product_id, 0) + amount
+            self._results = {}; self._changes += 1
+
+    @property
+    def version(self):
+        """
+        Muda a cada build() ou alteração do índice. O build() sorteia uma nova geração, então
+        índices de processos diferentes nunca têm a mesma versão.
+        """
+        return f"{self._generation}.{self._changes}"
+
+    def search(self, prefix, limit=5):
+        """Nomes (sem repetição) dos produtos mais populares que começam com 'prefix'."""
+        prefix = ' '.join(tokenize(prefix))
+        if not prefix: return []
+        ranked = self._results.get(prefix)
+        if ranked is None:
+            with self._lock:
+                entries = self._entries; ids = set()
+                i = bisect.bisect_left(entries, (prefix,))
+                while i < len(entries) and entries[i][0].startswith(prefix):
+                    ids.add(entries[i][1]); i += 1
+                ranked = heapq.nlargest(self.MAX_RANKED, ids, key=lambda pid: (self._popularity.get(pid, 0), pid))
+                if len(self._results) >= self.MAX_CACHED_PREFIXES: self._results = {}
+                self._results[prefix] = ranked
+        names = []
+        for product_id in ranked:
+            name = self._names.get(product_id)
+            if name is not None and name not in names:
+                names.append(name)
+                if len(names) == limit: break
+        return names
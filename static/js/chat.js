@@ -44,15 +44,14 @@ document.addEventListener('DOMContentLoaded', function() {
         socket.emit('join', { quote_id: quoteId });
     });
 
-    // 5. Ouvir por novas mensagens do servidor
-    socket.on('message', function(data) {
-        typingIndicator.textContent = ''; // Limpa o indicador ao receber uma mensagem
+    // 5. Montagem das mensagens (novas e do histórico)
+    const buildBubble = (data) => {
         const isSentByMe = data.sender_name === currentCompanyName;
-        
+
         const bubble = document.createElement('div');
         bubble.classList.add('message-bubble');
         bubble.classList.add(isSentByMe ? 'sent' : 'received');
-        
+
         if (data.message) {
             const messageText = document.createElement('div');
             messageText.textContent = data.message;
@@ -81,11 +80,46 @@ document.addEventListener('DOMContentLoaded', function() {
         const time = data.timestamp.split(' ')[1] || data.timestamp;
         messageInfo.textContent = `${data.sender_name} - ${time}`;
         bubble.appendChild(messageInfo);
+        return bubble;
+    };
 
-        messagesDiv.appendChild(bubble);
+    // Ouvir por novas mensagens do servidor
+    socket.on('message', function(data) {
+        typingIndicator.textContent = ''; // Limpa o indicador ao receber uma mensagem
+        messagesDiv.appendChild(buildBubble(data));
         messagesDiv.scrollTop = messagesDiv.scrollHeight;
     });
-    
+
+    // Histórico: páginas anteriores pedidas ao rolar até o topo
+    const historyLoader = document.getElementById('history-loader');
+    let historyCursor = messagesDiv.dataset.historyCursor;
+    let loadingHistory = false;
+
+    const loadHistory = () => {
+        if (loadingHistory || !historyCursor) return;
+        loadingHistory = true;
+        socket.emit('load_history', { quote_id: quoteId, before: historyCursor });
+    };
+
+    socket.on('history', function(data) {
+        // Insere as mensagens antigas acima das atuais mantendo a posição de leitura
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(m => fragment.appendChild(buildBubble(m)));
+        const previousHeight = messagesDiv.scrollHeight;
+        messagesDiv.insertBefore(fragment, historyLoader.nextSibling);
+        messagesDiv.scrollTop += messagesDiv.scrollHeight - previousHeight;
+        historyCursor = data.next_cursor;
+        if (!historyCursor) historyLoader.remove();
+        loadingHistory = false;
+    });
+
+    if (historyLoader) {
+        historyLoader.addEventListener('click', loadHistory);
+        messagesDiv.addEventListener('scroll', () => {
+            if (messagesDiv.scrollTop < 50) loadHistory();
+        });
+    }
+
     // 6. Lógica de Envio (Mensagem e Arquivo)
     const sendMessage = (message, attachmentFilename) => {
         if (!message && !attachmentFilename) return;
@@ -115,6 +149,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const formData = new FormData();
         formData.append('file', file);
+        formData.append('quote_id', quoteId);
 
         fetch('/chat/upload', {
             method: 'POST',
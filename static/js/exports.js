@@ -0,0 +1,56 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Acompanha os relatórios em andamento: consulta o progresso e recebe o aviso de conclusão pelo Socket.IO
+    const items = document.querySelectorAll('.export-item[data-pending="true"]');
+
+    function render(item, job) {
+        item.querySelector('.export-progress div').style.width = `${job.percent}%`;
+        const action = item.querySelector('.export-action');
+        action.innerHTML = '';
+        if (job.download_url) {
+            const link = document.createElement('a');
+            link.href = job.download_url;
+            link.className = 'cta-button';
+            link.style.textDecoration = 'none';
+            link.textContent = 'Baixar';
+            action.appendChild(link);
+        } else {
+            const label = document.createElement('span');
+            label.textContent = job.status === 'Falhou' ? 'Falhou' : `${job.status} (${job.percent}%)`;
+            if (job.error) label.title = job.error;
+            action.appendChild(label);
+        }
+        if (job.status !== 'Na fila' && job.status !== 'Gerando') item.dataset.pending = 'false';
+    }
+
+    function poll(item) {
+        if (item.dataset.pending !== 'true') return;
+        fetch(item.dataset.statusUrl)
+            .then(response => response.json())
+            .then(job => render(item, job))
+            .finally(() => {
+                if (item.dataset.pending === 'true') setTimeout(() => poll(item), 2000);
+            });
+    }
+
+    items.forEach(item => setTimeout(() => poll(item), 2000));
+
+    if (typeof io !== 'undefined') {
+        const socket = io();
+        socket.on('export_finished', function(job) {
+            const item = document.querySelector(`.export-item[data-job-id="${job.id}"]`);
+            if (item) render(item, job);
+        });
+    }
+
+    // Mostra só os status do relatório escolhido
+    const report = document.getElementById('report');
+    const status = document.getElementById('status');
+    function filterStatuses() {
+        status.querySelectorAll('option[data-report]').forEach(option => {
+            option.hidden = option.dataset.report !== report.value;
+        });
+        if (status.selectedOptions[0] && status.selectedOptions[0].hidden) status.value = '';
+    }
+    report.addEventListener('change', filterStatuses);
+    filterStatuses();
+});
@@ -0,0 +1,40 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Acompanha as importações em andamento: consulta o progresso e recebe o aviso de conclusão pelo Socket.IO
+    const items = document.querySelectorAll('.import-item[data-pending="true"]');
+
+    function render(item, job) {
+        item.querySelector('.import-progress div').style.width = `${job.percent}%`;
+        const label = item.querySelector('.import-status span');
+        label.textContent = job.status === 'Falhou' ? 'Falhou' : `${job.status} (${job.percent}%)`;
+        label.title = job.error || '';
+        item.querySelector('.import-counts').textContent = `${job.created} criados · ${job.updated} atualizados · ${job.error_count} com erro`;
+        const errors = item.querySelector('.import-errors');
+        errors.innerHTML = '';
+        job.errors.forEach(row => {
+            const line = document.createElement('li');
+            line.textContent = `Linha ${row.row}${row.sku ? ` (${row.sku})` : ''}: ${row.errors.join(' ')}`;
+            errors.appendChild(line);
+        });
+        if (job.status !== 'Na fila' && job.status !== 'Processando') item.dataset.pending = 'false';
+    }
+
+    function poll(item) {
+        if (item.dataset.pending !== 'true') return;
+        fetch(item.dataset.statusUrl)
+            .then(response => response.json())
+            .then(job => render(item, job))
+            .finally(() => {
+                if (item.dataset.pending === 'true') setTimeout(() => poll(item), 2000);
+            });
+    }
+
+    items.forEach(item => setTimeout(() => poll(item), 2000));
+
+    if (typeof io !== 'undefined') {
+        const socket = io();
+        socket.on('import_finished', function(job) {
+            const item = document.querySelector(`.import-item[data-job-id="${job.id}"]`);
+            if (item) render(item, job);
+        });
+    }
+});
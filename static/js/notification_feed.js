@@ -0,0 +1,48 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Rolagem infinita do feed de notificações (páginas via /notifications/feed)
+    const list = document.getElementById('notification-list');
+    const more = document.getElementById('notification-feed-more');
+    if (!list || !more) return;
+
+    let nextCursor = list.dataset.nextCursor;
+    let loading = false;
+
+    function renderItem(notification) {
+        const item = document.createElement('div');
+        item.className = 'notification-item';
+        const link = document.createElement('a');
+        link.href = notification.link || '#';
+        const message = document.createElement('p');
+        message.textContent = notification.message;
+        const time = document.createElement('small');
+        time.textContent = notification.timestamp;
+        link.appendChild(message);
+        link.appendChild(time);
+        item.appendChild(link);
+        return item;
+    }
+
+    function loadMore() {
+        if (loading || !nextCursor) return;
+        loading = true;
+        fetch(`${list.dataset.feedUrl}?before=${encodeURIComponent(nextCursor)}`)
+            .then(response => response.json())
+            .then(data => {
+                const fragment = document.createDocumentFragment();
+                data.notifications.forEach(n => fragment.appendChild(renderItem(n)));
+                list.appendChild(fragment);
+                nextCursor = data.next_cursor;
+                if (!nextCursor) more.style.display = 'none';
+            })
+            .finally(() => { loading = false; });
+    }
+
+    more.querySelector('button').addEventListener('click', loadMore);
+
+    // Carrega a próxima página automaticamente quando o botão aparece na tela
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) loadMore();
+        }).observe(more);
+    }
+});
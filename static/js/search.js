@@ -39,4 +39,19 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
-});
\ No newline at end of file
+});
+// Total de produtos do marketplace, carregado depois da página (a listagem por cursor não faz COUNT)
+document.addEventListener('DOMContentLoaded', function() {
+    const countElement = document.getElementById('products-count');
+    if (!countElement) return;
+
+    fetch(countElement.dataset.countUrl)
+        .then(response => response.json())
+        .then(data => {
+            if (data.more) {
+                countElement.textContent = `Mais de ${data.count} produtos encontrados`;
+            } else {
+                countElement.textContent = `${data.count} produto${data.count === 1 ? '' : 's'} encontrado${data.count === 1 ? '' : 's'}`;
+            }
+        });
+});
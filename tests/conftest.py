@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Fixtures dos testes que rodam o app no próprio processo do pytest, com um banco SQLite temporário."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """O módulo app, importado com um banco SQLite próprio e já migrado (Celery em modo eager)."""
+    tmp = tmp_path_factory.mktemp('app')
+    saved = dict(os.environ)
+    os.environ.update(DATABASE_URL=f"sqlite:///{tmp / 'app.db'}", CHAT_SPILL_FILE=str(tmp / 'chat_spill.jsonl'),
+                      CHAT_DEAD_LETTER_FILE=str(tmp / 'chat_dead_letter.jsonl'))
+    sys.path.insert(0, ROOT)
+    try:
+        import app as A
+    finally:
+        os.environ.clear(); os.environ.update(saved)
+    from flask_migrate import upgrade
+    A.app.config.update(TESTING=True, SERVER_NAME='localhost')
+    A.celery.conf.update(CELERY_ALWAYS_EAGER=True)
+    with A.app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        yield A
+
+
+@pytest.fixture
+def make_company(app_module):
+    """Cria uma empresa com nome único (o banco é compartilhado pelos testes da sessão)."""
+    created = []
+    def make(user_type, **kw):
+        name = f"{user_type}{len(created)}_{os.urandom(3).hex()}"
+        company = app_module.Company(company_name=name, cnpj=name[:18], email=f'{name}@x.com', user_type=user_type, **kw)
+        company.set_password('x'); app_module.db.session.add(company); app_module.db.session.commit()
+        created.append(company); return company
+    return make
+
+
+@pytest.fixture
+def client_for(app_module):
+    """Cliente de teste já logado como a empresa informada."""
+    def client(company):
+        test_client = app_module.app.test_client()
+        with test_client.session_transaction() as session:
+            session.update(company_id=company.id, company_name=company.company_name, user_type=company.user_type, is_admin=company.is_admin)
+        return test_client
+    return client
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Gravação do chat em lote (ChatWriter)."""
+import json
+from datetime import datetime
+
+
+def test_rejected_row_does_not_block_the_batch(app_module, make_company, tmp_path):
+    A = app_module
+    supplier = make_company('supplier'); buyer = make_company('buyer')
+    product = A.Product(name='P', description='d', category='C', supplier_id=supplier.id); A.db.session.add(product); A.db.session.flush()
+    quote = A.QuoteRequest(quantity=1, product_id=product.id, buyer_id=buyer.id, supplier_id=supplier.id); A.db.session.add(quote); A.db.session.commit()
+    writer = A.ChatWriter(0.01, 10, 0.05, str(tmp_path / 'spill.jsonl'), str(tmp_path / 'dead.jsonl')); writer._started = True
+    row = lambda text, sender_id: {'message': text, 'quote_id': quote.id, 'sender_id': sender_id, 'attachment_filename': None, 'attachment_type': None, 'timestamp': datetime.utcnow()}
+    writer.put(row('a', buyer.id)); writer.put(row('ruim', None)); writer.put(row('b', supplier.id))
+    assert writer.flush() == 2
+    assert sorted(m.message for m in A.ChatMessage.query.filter_by(quote_id=quote.id)) == ['a', 'b']
+    assert [json.loads(line)['message'] for line in open(tmp_path / 'dead.jsonl')] == ['ruim']
+    # Nada fica pendente nem em espera: o próximo lote é gravado normalmente
+    assert writer._pending == [] and writer._retry_at == 0.0
+    writer.put(row('c', buyer.id))
+    assert writer.flush() == 1
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""Estatísticas do painel (CompanyStats) mantidas por variações."""
+
+
+def test_delete_product_without_stats_row(app_module, make_company, client_for):
+    A = app_module
+    supplier = make_company('supplier'); buyer = make_company('buyer')
+    product = A.Product(name='P', description='d', category='C', supplier_id=supplier.id); A.db.session.add(product); A.db.session.flush()
+    for _ in range(3): A.db.session.add(A.QuoteRequest(quantity=1, product_id=product.id, buyer_id=buyer.id, supplier_id=supplier.id, status='Pendente'))
+    A.db.session.commit()
+    assert A.db.session.get(A.CompanyStats, supplier.id) is None
+    client_for(supplier).post(f'/product/{product.id}/delete')
+    A.db.session.expire_all()
+    assert A.QuoteRequest.query.filter_by(product_id=product.id).count() == 0
+    for company in (supplier, buyer):
+        stats = A.db.session.get(A.CompanyStats, company.id)
+        assert (stats.quotes_pending, stats.quotes_responded, stats.quotes_accepted, stats.quotes_declined) == (0, 0, 0, 0)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de integração do Socket.IO com dois processos do app ligados à mesma fila de mensagens.
+
+Sobe um servidor compatível com o Redis (fakeredis) como SOCKETIO_MESSAGE_QUEUE, dois processos
+do app em portas diferentes e um cliente em cada um, e verifica que as salas do chat (quote_<id>)
+e de notificações (user_<id>) funcionam entre os processos.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+requests = pytest.importorskip('requests')
+socketio = pytest.importorskip('socketio')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = """
+import app as A
+with A.app.app_context():
+    ids = []
+    for name, kind in (('buyer', 'buyer'), ('supplier', 'supplier')):
+        c = A.Company(company_name=name, cnpj=name, email=name + '@x.com', user_type=kind); c.set_password('x')
+        A.db.session.add(c); A.db.session.commit(); ids.append(c.id)
+    p = A.Product(name='P', description='d', category='C', supplier_id=ids[1]); A.db.session.add(p); A.db.session.flush()
+    q = A.QuoteRequest(quantity=1, product_id=p.id, buyer_id=ids[0], supplier_id=ids[1], status='Respondido')
+    A.db.session.add(q); A.db.session.commit(); print(q.id)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0)); return s.getsockname()[1]
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition(): return True
+        time.sleep(0.1)
+    return False
+
+
+def server_up(port):
+    try: return requests.get(f'http://127.0.0.1:{port}/login', timeout=1).ok
+    except requests.ConnectionError: return False
+
+
+@pytest.fixture
+def two_processes(tmp_path):
+    """Fila compartilhada + banco SQLite + dois processos do app. Retorna (portas, id da cotação)."""
+    queue_port = free_port()
+    server = fakeredis.TcpFakeServer(('127.0.0.1', queue_port), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'app.db'}", FLASK_APP='app.py', CHAT_FLUSH_INTERVAL='0.2',
+               SOCKETIO_MESSAGE_QUEUE=f'redis://127.0.0.1:{queue_port}/0', CELERY_BROKER_URL=f'redis://127.0.0.1:{queue_port}/1', CELERY_RESULT_BACKEND=f'redis://127.0.0.1:{queue_port}/2',
+               CHAT_SPILL_FILE=str(tmp_path / 'chat_spill.jsonl'), CHAT_DEAD_LETTER_FILE=str(tmp_path / 'chat_dead_letter.jsonl'))
+    subprocess.run([sys.executable, '-m', 'flask', 'db', 'upgrade'], cwd=ROOT, env=env, check=True, capture_output=True)
+    quote_id = subprocess.run([sys.executable, '-c', SETUP], cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout.split()[-1]
+    ports = [free_port(), free_port()]
+    procs = [subprocess.Popen([sys.executable, '-c', f"import app as A; A.socketio.run(A.app, port={port}, allow_unsafe_werkzeug=True)"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for port in ports]
+    try:
+        assert all(wait_until(lambda port=port: server_up(port), timeout=30) for port in ports), 'os processos do app não subiram'
+        yield ports, quote_id
+    finally:
+        for proc in procs: proc.terminate()
+        for proc in procs: proc.wait(timeout=10)
+        server.shutdown(); server.server_close()
+
+
+def connect(port, email, quote_id):
+    http = requests.Session(); http.post(f'http://127.0.0.1:{port}/login', data={'email': email, 'password': 'x'})
+    client = socketio.Client(http_session=http); received = []
+    client.on('message', lambda data: received.append(('message', data['message'])))
+    client.on('new_notification', lambda data: received.append(('new_notification', data)))
+    client.connect(f'http://127.0.0.1:{port}'); client.emit('join', {'quote_id': quote_id})
+    return http, client, received
+
+
+def test_rooms_work_across_processes(two_processes):
+    (port_1, port_2), quote_id = two_processes
+    buyer_http, buyer, buyer_got = connect(port_1, 'buyer@x.com', quote_id)
+    supplier_http, supplier, supplier_got = connect(port_2, 'supplier@x.com', quote_id)
+    try:
+        time.sleep(0.5)  # os dois entram na sala antes das mensagens
+        # Chat: cada mensagem chega ao cliente conectado no outro processo
+        supplier.emit('send_message', {'quote_id': quote_id, 'message': 'olá do processo 2'})
+        buyer.emit('send_message', {'quote_id': quote_id, 'message': 'olá do processo 1'})
+        assert wait_until(lambda: ('message', 'olá do processo 2') in buyer_got)
+        assert wait_until(lambda: ('message', 'olá do processo 1') in supplier_got)
+        # Notificação emitida por uma requisição HTTP no processo 1 chega ao fornecedor conectado no processo 2
+        assert buyer_http.post(f'http://127.0.0.1:{port_1}/quote/{quote_id}/accept').ok
+        assert wait_until(lambda: any(event == 'new_notification' for event, _ in supplier_got))
+        # O histórico gravado por um processo é lido pelo outro (cada processo grava o chat em lote, a cada CHAT_FLUSH_INTERVAL)
+        history = lambda: {m['message'] for m in supplier_http.get(f'http://127.0.0.1:{port_2}/chat/{quote_id}/history').json()['messages']}
+        assert wait_until(lambda: {'olá do processo 1', 'olá do processo 2'} <= history())
+    finally:
+        buyer.disconnect(); supplier.disconnect()